@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+import mysql.connector
+
+# Both modes query the table on every request: the response cache and the pre-rendered documents are turned
+# off before the API module reads its settings, so the difference shown is the connection handling alone
+os.environ['API_CACHE_SIZE'] = '0'
+os.environ['API_DOCUMENTS'] = 'false'
+import query_progress_tracker_table as api
+
+# Local load test of the lookup API against the database in .env
+#
+# Usage: python load_test.py [--requests 500] [--sample 100] [--seed 0]
+# Sends the same random mix of appl_id / proj_num / hdp_id lookups (taken from the table) two ways:
+#   per_request  a new connection and a plain cursor for every lookup, closed afterwards (the old handler)
+#   warm         lambda_handler with one kept connection, pinged once per request, and prepared lookup statements
+# and reports the latency percentiles of each. The warm mode also builds and serializes the response, so the
+# difference shown is what the kept connection saves net of that work (with the cache and documents off, see below)
+
+# Query string parameters of `count` requests, each with one identifier drawn from `sample` rows of the table
+def sample_requests(count, sample, seed):
+    connection = connect()
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT appl_id, project_num, hdp_id FROM {api.table_name} LIMIT %s;", (sample,))
+    rows = cursor.fetchall()
+    cursor.close()
+    connection.close()
+    if not rows:
+        sys.exit(f"{api.table_name} is empty")
+
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        appl_id, project_num, hdp_id = rng.choice(rows)
+        param, value = rng.choice([(param, value) for param, value in [('appl_id', appl_id), ('proj_num', project_num), ('hdp_id', hdp_id)] if value])
+        requests.append({param: value})
+    return requests
+
+def connect():
+    return mysql.connector.connect(user=api.db_username, password=api.db_password, host=api.db_host, database=api.db_database)
+
+def per_request(params):
+    lookups = api.identifier_lookups(params)
+    connection = connect()
+    cursor = connection.cursor()
+    cursor.execute(api.lookup_query([column for column, _ in lookups]), [value for _, value in lookups])
+    cursor.fetchall()
+    cursor.close()
+    connection.close()
+
+def warm(params):
+    return api.lambda_handler({'queryStringParameters': params}, None)
+
+def run(func, requests):
+    latencies = []
+    for params in requests:
+        start = time.perf_counter()
+        func(params)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def print_results(results):
+    print(f"{'mode':<12} {'requests':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for mode, latencies in results.items():
+        print(f"{mode:<12} {len(latencies):>9} {statistics.mean(latencies):>9.2f} {percentile(latencies, 50):>9.2f} "
+              f"{percentile(latencies, 95):>9.2f} {percentile(latencies, 99):>9.2f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare per-request connections with the warm connection of the lookup API')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--sample', type=int, default=100, help='table rows the identifiers are drawn from')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    requests = sample_requests(args.requests, args.sample, args.seed)
+    results = {'per_request': run(per_request, requests), 'warm': run(warm, requests)}
+    print_results(results)
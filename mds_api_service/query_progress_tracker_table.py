@@ -1,28 +1,175 @@
 import json
 import os
+import time
+import base64
 import mysql.connector
+from mysql.connector import FieldType
 from decimal import Decimal
-from datetime import datetime
+from datetime import date, datetime
 from dotenv import load_dotenv
+from response_cache import ResponseCache
 
 class EnhancedEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, Decimal):
             return float(obj)  # Convert Decimal to float
-        if isinstance(obj, datetime):
-            return obj.isoformat()  # Convert datetime to ISO 8601 string
+        if isinstance(obj, (date, datetime)):
+            return obj.isoformat()  # Convert date / datetime to ISO 8601 string
         return super(EnhancedEncoder, self).default(obj)
 
-def parse_json_fields(data):
-    json_fields = ['investigators_name', 'repository_metadata', 'dmp_plan', 'heal_cde_used', 'vlmd_metadata']
-    for field in json_fields:
-        if field in data and isinstance(data[field], str):
-            try:
-                data[field] = json.loads(data[field].replace("'", "\""))  # Replace single quotes with double quotes
-            except json.JSONDecodeError:
-                pass  # If it fails, keep it as a string
+# Lookup keys as the sync stores them in the *_norm columns (see mds_data_sync/progress_tracker_schema.py):
+# dashes stripped, upper-cased
+def normalized(value):
+    return value.replace('-', '').strip().upper()
+
+# Query string parameter -> normalized column it is matched on
+IDENTIFIER_COLUMNS = {'appl_id': 'appl_id_norm', 'proj_num': 'project_num_norm', 'hdp_id': 'hdp_id_norm'}
+
+# appl_ids only lose their dashes with a CTN prefix; project numbers and HDP IDs always do
+def lookup_value(param, value):
+    if param == 'appl_id' and not value.upper().startswith('CTN'):
+        return value.strip().upper()
+    return normalized(value)
+
+# (normalized column, value) for each identifier in the query string parameters
+def identifier_lookups(params):
+    lookups = []
+    for param, column in IDENTIFIER_COLUMNS.items():
+        value = (params.get(param) or '').strip()
+        if value:
+            lookups.append((column, lookup_value(param, value)))
+    return lookups
+
+# A request body the API cannot read; answered with a 400
+class BadRequest(ValueError):
+    pass
+
+# The JSON object in the body of a request, {} without one
+def request_body(event):
+    body = event.get('body')
+    if not body:
+        return {}
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    try:
+        data = json.loads(body)
+    except ValueError as e:
+        raise BadRequest(f"the request body is not valid JSON: {e}")
+    if not isinstance(data, dict):
+        raise BadRequest("the request body must be a JSON object")
     return data
 
+# A body value as text: strings as given, whole numbers without a fraction (10056337 and 10056337.0 alike);
+# None for anything else, including true / false
+def body_text(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return None
+
+# Values of `name` in a request body as strings: a list of values, or a single value such as {"appl_id": 10056337}
+def body_values(data, name):
+    values = data.get(name)
+    if values is None:
+        return []
+    texts = [body_text(value) for value in (values if isinstance(values, list) else [values])]
+    if None in texts:
+        raise BadRequest(f'"{name}" must be a string or whole number, or a list of them')
+    return texts
+
+# Identifiers of a request, param -> values in the order given (duplicates and blanks dropped), from a JSON
+# body ({"appl_id": [...], "proj_num": [...], "hdp_id": [...]}), repeated query string parameters or comma-separated values
+def requested_identifiers(event):
+    requested = {}
+    data = request_body(event)
+    for param in IDENTIFIER_COLUMNS:
+        if param in data:
+            requested[param] = body_values(data, param)
+    params = event.get('queryStringParameters') or {}
+    multi = event.get('multiValueQueryStringParameters') or {}
+    for param in IDENTIFIER_COLUMNS:
+        for given in multi.get(param) or ([params[param]] if params.get(param) else []):
+            requested.setdefault(param, []).extend(given.split(','))
+    return {param: list(dict.fromkeys(value.strip() for value in values if value.strip()))
+            for param, values in requested.items() if any(value.strip() for value in values)}
+
+# A request is a batch when it has a body, asks for one (batch=true) or gives more than one value for an identifier
+def is_batch(event, requested):
+    params = event.get('queryStringParameters') or {}
+    return (bool(event.get('body')) or (params.get('batch') or '').lower() in ('1', 'true', 'yes')
+            or any(len(values) > 1 for values in requested.values()))
+
+# Field names of a request, as given: `fields=a,b` (comma-separated or repeated) or "fields" in a JSON body
+def requested_fields(event):
+    fields = []
+    for given in body_values(request_body(event), 'fields'):
+        fields += given.split(',')
+    params = event.get('queryStringParameters') or {}
+    multi = event.get('multiValueQueryStringParameters') or {}
+    for given in multi.get('fields') or ([params['fields']] if params.get('fields') else []):
+        fields += given.split(',')
+    return list(dict.fromkeys(field.strip() for field in fields if field.strip()))
+
+# A request without identifiers lists the table page by page when it asks for it (list=true) or continues a listing (cursor=..)
+def is_listing(event):
+    params = event.get('queryStringParameters') or {}
+    return (params.get('list') or '').lower() in ('1', 'true', 'yes') or bool(params.get('cursor'))
+
+# Responses are cached per normalized (appl_id, proj_num, hdp_id) triple and projection
+def cache_key(lookups, projection=None):
+    values = dict(lookups)
+    return tuple(values.get(column, '') for column in ('appl_id_norm', 'project_num_norm', 'hdp_id_norm')) + (projection,)
+
+# `*`, or the projected columns quoted; every name in a projection comes from the table itself (see projection())
+def select_list(projection):
+    return '*' if projection is None else ', '.join(f'`{column}`' for column in projection)
+
+# One indexed equality lookup per identifier given, combined with UNION ALL
+def lookup_query(columns, projection=None):
+    return ' UNION ALL '.join(f"(SELECT {select_list(projection)} FROM {table_name} WHERE {column} = %s)" for column in columns) + ';'
+
+# Keyset pagination: the page after `after` in hdp_id (primary key) order, one row more than the page to tell if
+# another follows
+def list_query(projection=None):
+    return f"SELECT {select_list(projection)} FROM {table_name} WHERE hdp_id > %s ORDER BY hdp_id LIMIT %s;"
+
+# Listing cursors are the last hdp_id of the previous page, base64url-encoded so clients treat them as opaque
+def encode_cursor(hdp_id):
+    return base64.urlsafe_b64encode(hdp_id.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    try:
+        return base64.b64decode(token + '=' * (-len(token) % 4), altchars=b'-_', validate=True).decode('utf-8')
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"invalid cursor {token!r}")
+
+# Columns kept for the sync's own use and left out of responses
+INTERNAL_COLUMNS = ['appl_id_norm', 'project_num_norm', 'hdp_id_norm', 'row_hash']
+
+# Columns MySQL returns as JSON text (investigators_name, repository_metadata, dmp_plan, heal_cde_used)
+def json_columns(description):
+    return {column[0] for column in description if len(column) > 1 and column[1] == FieldType.JSON}
+
+# BOOLEAN flags (is_registered, manifest_exists, ...), which MySQL returns as TINYINT; the table has no other TINYINT columns
+def flag_columns(description):
+    return {column[0] for column in description if len(column) > 1 and column[1] == FieldType.TINY}
+
+# Flags go out as "Yes" / "No", as they did when the table stored them as text
+def yes_no(value):
+    return None if value is None else ('Yes' if value else 'No')
+
+# JSON object of a study without its internal columns. The JSON columns' text goes into it as it is, after the
+# other columns, instead of being decoded and encoded again
+def study_json(record, raw_columns, flags=()):
+    values = {column: yes_no(value) if column in flags else value for column, value in record.items()
+              if column not in INTERNAL_COLUMNS and column not in raw_columns}
+    fields = [json.dumps(values, cls=EnhancedEncoder)[1:-1]] if values else []
+    fields += [f'{json.dumps(column)}: {"null" if record[column] is None else record[column]}' for column in record if column in raw_columns]
+    return '{' + ', '.join(fields) + '}'
+
 load_dotenv()
 
 # Accessing variables
@@ -31,63 +178,327 @@ db_password = os.getenv('DB_PASSWORD')
 db_host = os.getenv('DB_HOST')
 db_database = os.getenv('DB_NAME')
 table_name = os.getenv('TABLE_NAME')
+# API_PREPARED_STATEMENTS=false sends the lookups as plain text queries
+prepared_statements = os.getenv('API_PREPARED_STATEMENTS', 'true').lower() in ('1', 'true', 'yes')
+# Prepared statements kept per connection; a projection is its own statement, so the least recently prepared
+# ones are closed beyond this many
+max_statements = int(os.getenv('API_MAX_STATEMENTS', 64))
 
-def lambda_handler(event, context):
-    appl_id = proj_num = hdp_id = ''
-    results = []
+# Listing pages have API_LIST_LIMIT studies unless the request asks for up to API_LIST_MAX (limit=..)
+list_limit = int(os.getenv('API_LIST_LIMIT', 100))
+list_max = int(os.getenv('API_LIST_MAX', 1000))
 
-    try:
-        appl_id = event['queryStringParameters'].get('appl_id', '')
-        proj_num = event['queryStringParameters'].get('proj_num', '')
-        hdp_id = event['queryStringParameters'].get('hdp_id', '').upper()
+# Batch requests take up to API_BATCH_MAX identifiers, looked up API_BATCH_CHUNK at a time
+batch_max = int(os.getenv('API_BATCH_MAX', 5000))
+batch_chunk = int(os.getenv('API_BATCH_CHUNK', 500))
 
-        if appl_id.startswith('CTN'):
-            normalized_appl_id = appl_id.replace('-', '')  # Remove dashes if CTN prefix is present
-        else:
-            normalized_appl_id = appl_id
+# Up to API_CACHE_SIZE responses are cached per data version for at most API_CACHE_TTL seconds (API_CACHE_SIZE=0 turns the cache off)
+response_cache = ResponseCache(size=int(os.getenv('API_CACHE_SIZE', 1024)), ttl=float(os.getenv('API_CACHE_TTL', 300)))
+# A data version read from MySQL is reused for API_VERSION_CHECK_SECONDS, so cache hits in between skip MySQL
+# entirely, at the cost of serving the previous sync's data for up to that long after a sync. 0 reads the version
+# on every request, so a cached response is never from an older sync
+version_check_seconds = float(os.getenv('API_VERSION_CHECK_SECONDS', 5))
+_data_version = (None, 0.0)
 
-        normalized_proj_num = proj_num.replace('-', '')  # Remove dashes from proj_num
+# Single-identifier and batch lookups are answered from the documents the sync pre-renders into `<table>__documents`
+# (see mds_data_sync/study_documents.py) with primary key reads; API_DOCUMENTS=false always queries the table
+use_documents = os.getenv('API_DOCUMENTS', 'true').lower() in ('1', 'true', 'yes')
+# (missing, data version when found missing): without the documents table the lookups query the table, and it is
+# looked for again once a sync stamps a new data version
+_documents_missing = (False, None)
 
-        conn = mysql.connector.connect(
-            user=db_username, 
-            password=db_password, 
-            host=db_host, 
+# One connection per Lambda container, opened on first use and kept across warm invocations
+_connection = None
+# Whether the connection was checked in this invocation: it is pinged on its first use in each invocation
+# only (lambda_handler resets this), so a request that is answered from the cache never touches MySQL
+_connection_checked = False
+# Lookup query and cursor for each combination of identifier columns, kept with the connection. A prepared
+# cursor re-executes its statement without preparing it again as long as it is given the same query string
+_statements = {}
+# The table's columns, read once per connection; they are the fields a request can project
+_columns = []
+
+def get_connection():
+    global _connection, _connection_checked
+    if _connection is None:
+        _connection = mysql.connector.connect(
+            user=db_username,
+            password=db_password,
+            host=db_host,
             database=db_database
         )
+        _statements.clear()
+        _columns.clear()
+        _connection_checked = True
+        return _connection
+    if _connection_checked:
+        return _connection
+    # Reconnects a connection the server dropped while the container was frozen; prepared statements
+    # do not survive a reconnect, so they are prepared again on the new session
+    connection_id = _connection.connection_id
+    _connection.ping(reconnect=True, attempts=3, delay=1)
+    if _connection.connection_id != connection_id:
+        _statements.clear()
+        _columns.clear()
+    _connection_checked = True
+    return _connection
 
-        cursor = conn.cursor()
+def reset_connection():
+    global _connection
+    if _connection is not None:
+        try:
+            _connection.close()
+        except mysql.connector.Error:
+            pass
+    _connection = None
+    _statements.clear()
+    _columns.clear()
 
-        # Sample query - modify as needed
-        query = f"SELECT * FROM {table_name} WHERE REPLACE(appl_id, '-', '')=%s OR REPLACE(project_num, '-', '')=%s OR REPLACE(hdp_id, '-', '')=%s;"
-        cursor.execute(query, (normalized_appl_id, normalized_proj_num, hdp_id))
+# Query string and cursor for `key`, kept with the connection
+def cached_statement(connection, key, build_query):
+    if key not in _statements:
+        while len(_statements) >= max_statements:
+            _statements.pop(next(iter(_statements)))[1].close()
+        _statements[key] = (build_query(), connection.cursor(prepared=prepared_statements))
+    return _statements[key]
 
-        # Check if the cursor.description is not None
-        if cursor.description is not None:
-            columns = [column[0] for column in cursor.description]
+def lookup_statement(connection, columns, projection=None):
+    return cached_statement(connection, (tuple(columns), projection), lambda: lookup_query(columns, projection))
+
+# Columns of the response to `fields`, in table order and always with hdp_id; None (every column) without fields.
+# Only the table's own columns (less the internal ones) can be asked for, so a projection never carries request text into SQL
+def projection(fields):
+    if not fields:
+        return None
+    if not _columns:
+        cursor = get_connection().cursor()
+        try:
+            cursor.execute(f"SELECT * FROM {table_name} LIMIT 0;")
+            cursor.fetchall()
+            _columns.extend(column[0] for column in cursor.description)
+        finally:
+            cursor.close()
+    available = [column for column in _columns if column not in INTERNAL_COLUMNS]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ValueError(f"unknown field(s) {', '.join(unknown)}; the fields are {', '.join(available)}")
+    return tuple(column for column in available if column == 'hdp_id' or column in fields)
+
+# Current data version of the table, stamped by every sync that changes it (None before the first stamp)
+def data_version():
+    global _data_version
+    version, checked = _data_version
+    if version is not None and time.monotonic() - checked < version_check_seconds:
+        return version
+    query, cursor = cached_statement(get_connection(), ('data_version',),
+                                     lambda: f"SELECT data_version FROM {table_name}__version WHERE id = 1;")
+    try:
+        cursor.execute(query)
+        rows = cursor.fetchall()
+    except mysql.connector.ProgrammingError:
+        # No version table yet: responses are not cached until the sync stamps one
+        _statements.pop(('data_version',), None)
+        return None
+    version = text_values(rows[0])[0] if rows else None
+    _data_version = (version, time.monotonic())
+    return version
+
+# The binary protocol of prepared statements can hand back text as bytes
+def text_values(row):
+    return [value.decode('utf-8') if isinstance(value, (bytes, bytearray)) else value for value in row]
+
+# `version` is the data version when the caller already read it
+def documents_usable(version=None):
+    missing, missing_version = _documents_missing
+    return use_documents and (not missing or (version or data_version()) != missing_version)
+
+def document_key(column, value):
+    return f'{column}:{value}'
+
+# Pre-rendered response bodies of `lookups` ((normalized column, value) pairs), for those that match a study,
+# read by primary key; None when the sync has not built the documents table
+def stored_documents(lookups):
+    global _documents_missing
+    keys = {document_key(column, value): (column, value) for column, value in lookups}
+    connection = get_connection()
+    try:
+        if len(keys) == 1:
+            query, cursor = cached_statement(connection, ('documents',),
+                                             lambda: f"SELECT lookup_key, document FROM {table_name}__documents WHERE lookup_key = %s;")
+            cursor.execute(query, list(keys))
             rows = cursor.fetchall()
-            for row in rows:
-                result = dict(zip(columns, row))
-                result = parse_json_fields(result)
-                results.append(result)
         else:
-            results = "No results returned or query did not execute successfully."
+            rows = []
+            cursor = connection.cursor()
+            try:
+                for start in range(0, len(keys), batch_chunk):
+                    chunk = list(keys)[start:start + batch_chunk]
+                    cursor.execute(f"SELECT lookup_key, document FROM {table_name}__documents "
+                                   f"WHERE lookup_key IN ({', '.join(['%s'] * len(chunk))});", chunk)
+                    rows += cursor.fetchall()
+            finally:
+                cursor.close()
+    except mysql.connector.ProgrammingError:
+        _statements.pop(('documents',), None)
+        _documents_missing = (True, data_version())
+        return None
+    _documents_missing = (False, None)
+    return {keys[key]: document for key, document in (text_values(row) for row in rows)}
 
-        # Close the cursor and the connection
+# Response bodies of `lookups` that match a study, from chunked UNION ALLs of one indexed IN (...) lookup per
+# identifier column; with a projection only those columns (and the identifier columns matched on) are read
+def queried_documents(lookups, projection=None):
+    studies = {}
+    matches = {}
+    cursor = get_connection().cursor()
+    try:
+        for start in range(0, len(lookups), batch_chunk):
+            by_column = {}
+            for column, value in lookups[start:start + batch_chunk]:
+                by_column.setdefault(column, []).append(value)
+            selected = select_list(projection and projection + tuple(by_column))
+            query = ' UNION ALL '.join(f"(SELECT {selected} FROM {table_name} WHERE {column} IN ({', '.join(['%s'] * len(values))}))"
+                                       for column, values in by_column.items()) + ';'
+            cursor.execute(query, [value for values in by_column.values() for value in values])
+            columns = [column[0] for column in cursor.description]
+            raw_columns = json_columns(cursor.description)
+            flags = flag_columns(cursor.description)
+            for row in cursor.fetchall():
+                record = dict(zip(columns, text_values(row)))
+                if record['hdp_id'] not in studies:
+                    studies[record['hdp_id']] = study_json(record, raw_columns, flags)
+                for column in by_column:
+                    matches.setdefault((column, record[column]), []).append(record['hdp_id'])
+    finally:
         cursor.close()
-        conn.close()
+    return {lookup: f"[{', '.join(studies[hdp_id] for hdp_id in dict.fromkeys(hdp_ids))}]" for lookup, hdp_ids in matches.items()}
+
+# Resolve every requested identifier, from the pre-rendered documents when there are any
+# Returns a body with the matching studies grouped by parameter and identifier as given, and the identifiers nothing matched
+def batch_lookup(requested, projection=None):
+    identifiers = [(param, value) for param, values in requested.items() for value in values]
+    if len(identifiers) > batch_max:
+        raise ValueError(f"{len(identifiers)} identifiers requested; the limit is {batch_max}")
+    lookups = list(dict.fromkeys((IDENTIFIER_COLUMNS[param], lookup_value(param, value)) for param, value in identifiers))
+    # The documents hold every column, so a projection is always queried
+    documents = stored_documents(lookups) if projection is None and documents_usable() else None
+    if documents is None:
+        documents = queried_documents(lookups, projection)
+
+    results = {param: [] for param in requested}
+    not_found = {param: [] for param in requested}
+    for param, value in identifiers:
+        document = documents.get((IDENTIFIER_COLUMNS[param], lookup_value(param, value)))
+        if document:
+            results[param].append(f"{json.dumps(value)}: {document}")
+        else:
+            not_found[param].append(value)
+    groups = ', '.join(f"{json.dumps(param)}: {{{', '.join(found)}}}" for param, found in results.items())
+    return f'{{"results": {{{groups}}}, "not_found": {json.dumps(not_found)}}}'
+
+# Studies matching any of `lookups`, as a response body; cached per data version
+def lookup(lookups, projection=None):
+    key = cache_key(lookups, projection)
+    version = data_version() if response_cache.size > 0 else None
+    body = response_cache.get(key, version)
+    if body is not None:
+        return body
+
+    # One identifier: its pre-rendered document is the response as it is
+    if len(lookups) == 1 and projection is None and documents_usable(version):
+        documents = stored_documents(lookups)
+        if documents is not None:
+            body = documents.get(lookups[0], '[]')
+            response_cache.put(key, version, body)
+            return body
+
+    query, cursor = lookup_statement(get_connection(), [column for column, _ in lookups], projection)
+    cursor.execute(query, [value for _, value in lookups])
+
+    # Check if the cursor.description is not None
+    if cursor.description is None:
+        return json.dumps("No results returned or query did not execute successfully.")
+    columns = [column[0] for column in cursor.description]
+    raw_columns = json_columns(cursor.description)
+    flags = flag_columns(cursor.description)
+    rows = cursor.fetchall()
+    # A study matched by more than one identifier comes back once
+    results = []
+    seen = set()
+    for row in rows:
+        result = dict(zip(columns, text_values(row)))
+        if result['hdp_id'] in seen:
+            continue
+        seen.add(result['hdp_id'])
+        results.append(study_json(result, raw_columns, flags))
+    body = f"[{', '.join(results)}]"
+    response_cache.put(key, version, body)
+    return body
+
+# One page of the whole table in hdp_id order, `limit` studies from after the cursor's hdp_id; cached per data version
+def list_page(token=None, limit=None, projection=None):
+    after = decode_cursor(token) if token else ''
+    limit = min(max(int(limit or list_limit), 1), list_max)
+    key = ('list', after, limit, projection)
+    version = data_version() if response_cache.size > 0 else None
+    body = response_cache.get(key, version)
+    if body is not None:
+        return body
+
+    query, cursor = cached_statement(get_connection(), ('list', projection), lambda: list_query(projection))
+    cursor.execute(query, [after, limit + 1])
+    columns = [column[0] for column in cursor.description]
+    raw_columns = json_columns(cursor.description)
+    flags = flag_columns(cursor.description)
+    rows = [dict(zip(columns, text_values(row))) for row in cursor.fetchall()]
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1]['hdp_id']) if len(rows) > limit else None
+    body = f'{{"results": [{", ".join(study_json(record, raw_columns, flags) for record in page)}], "next_cursor": {json.dumps(next_cursor)}}}'
+    response_cache.put(key, version, body)
+    return body
+
+# ?appl_id=..&proj_num=..&hdp_id=..  -> list of the studies matching any of the identifiers
+# Batch: several values for an identifier (comma-separated or repeated), batch=true, or a JSON body {"appl_id": [..], ..}
+#   -> {"results": {param: {identifier: [studies]}}, "not_found": {param: [identifiers]}}
+# Listing: ?list=true[&limit=..], then ?cursor=<next_cursor> until next_cursor is null
+#   -> {"results": [studies], "next_cursor": ..}
+# fields=a,b (or "fields": [..] in a body) returns only those columns of each study, and hdp_id
+# A body that is not a JSON object of strings and whole numbers is answered with a 400
+def lambda_handler(event, context):
+    global _connection_checked
+    _connection_checked = False
+    try:
+        requested = requested_identifiers(event)
+        columns = projection(requested_fields(event))
+        params = event.get('queryStringParameters') or {}
+        if not requested:
+            if not is_listing(event):
+                raise ValueError("no appl_id, proj_num or hdp_id given (list=true lists every study)")
+            body = list_page(params.get('cursor'), params.get('limit'), columns)
+        elif is_batch(event, requested):
+            body = batch_lookup(requested, columns)
+        else:
+            body = lookup(identifier_lookups({param: values[0] for param, values in requested.items()}), columns)
 
     except mysql.connector.Error as e:
-        results = f"Database error: {e}"
+        # Start the next request from a fresh connection
+        reset_connection()
+        body = json.dumps(f"Database error: {e}")
+    except BadRequest as e:
+        return response(json.dumps(f"Bad request: {e}"), status_code=400)
     except Exception as e:
-        results = f"Execution error: {e}"
+        body = json.dumps(f"Execution error: {e}")
+
+    return response(body)
 
+def response(body, status_code=200):
     return {
-        'statusCode': 200,
+        'statusCode': status_code,
         'headers': {
             "Content-Type": "application/json",
             "Access-Control-Allow-Origin": "*"
         },
-        'body': json.dumps(results, cls=EnhancedEncoder)
+        'body': body
     }
 
 # test = lambda_handler(0, 0)
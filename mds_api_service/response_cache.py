@@ -0,0 +1,35 @@
+import time
+from collections import OrderedDict
+
+# In-process LRU cache of response bodies, each tagged with the table's data version when it was built
+# (see mds_data_sync/progress_tracker_loader.stamp_data_version). An entry is only served while the version
+# is unchanged and it is younger than `ttl` seconds; the least recently used entry goes once there are `size`
+class ResponseCache:
+    def __init__(self, size=1024, ttl=300.0):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        entry = self.entries.get(key)
+        if entry is None or version is None or entry[0] != version or entry[1] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key, version, body):
+        if self.size <= 0 or version is None:
+            return
+        self.entries[key] = (version, time.monotonic() + self.ttl, body)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
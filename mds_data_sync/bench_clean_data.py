@@ -0,0 +1,58 @@
+import io
+import time
+import argparse
+import contextlib
+import numpy as np
+import pandas as pd
+from mds_data_prep import clean_data, gather_metadata
+from mds_synthetic import generate_mds
+
+# Benchmark the column-wise clean_data against the original cell-by-cell version on a synthetic gen3 frame
+#
+# Usage: python bench_clean_data.py [--guids 15000]
+
+# The original implementation, kept here as the reference for results and timings
+def clean_data_reference(df):
+    for col in df.columns:
+        for i in range(len(df)):
+            if type(df[col].iloc[i]) == bool or type(df[col].iloc[i]) == np.bool_:
+                continue
+            elif type(df[col].iloc[i]) == dict:
+                if not any(list(df[col].iloc[i].values())):
+                    df.at[i, col]= np.nan
+            elif type(df[col].iloc[i]) == int or type(df[col].iloc[i]) == np.float64 or type(df[col].iloc[i]) == float:
+                continue
+            elif type(df[col].iloc[i]) == list:
+                if len(df[col].iloc[i]) == 0:
+                    df.at[i, col]= np.nan
+    return df
+
+# The gen3 frame as transform_data builds it, before cleaning
+def gen3_frame(guids):
+    with contextlib.redirect_stdout(io.StringIO()):
+        metadata, _, _ = gather_metadata(generate_mds(guids))
+    df = pd.DataFrame.from_dict(metadata['gen3_metadata']).T
+    df.index.name = 'guids'
+    return df.reset_index()
+
+def timed(func, df):
+    start = time.perf_counter()
+    result = func(df)
+    return result, time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark clean_data on a synthetic gen3 frame')
+    parser.add_argument('--guids', type=int, default=15000)
+    parser.add_argument('--skip-reference', action='store_true', help='only time the column-wise version')
+    args = parser.parse_args()
+
+    df = gen3_frame(args.guids)
+    print(f"frame: {df.shape[0]} rows x {df.shape[1]} columns")
+
+    cleaned, seconds = timed(clean_data, df.copy())
+    print(f"clean_data            {seconds:10.3f}s")
+    if not args.skip_reference:
+        reference, reference_seconds = timed(clean_data_reference, df.copy())
+        print(f"clean_data_reference  {reference_seconds:10.3f}s  ({reference_seconds / seconds:.0f}x slower)")
+        assert cleaned.equals(reference), 'column-wise clean_data differs from the reference'
+        print("results identical")
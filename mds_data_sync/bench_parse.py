@@ -0,0 +1,103 @@
+import io
+import copy
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import contextlib
+import mds_data_prep as prep
+from mds_synthetic import generate_mds, BASE_GUID_COUNT
+
+# Benchmark parse_mds_response stage by stage on synthetic MDS catalogs
+#
+# Usage: python bench_parse.py [--scales 1 10 100] [--base 1500] [--json out.json] [--baseline old.json --tolerance 1.5]
+#                              [--workers 2 4 8]
+# Reports wall time and peak traced memory (allocations made during the stage) for every stage at every scale.
+# --workers also times the whole parse serially and sharded over each number of processes.
+# With --baseline the run fails if any stage is more than `tolerance` times slower than the saved results.
+
+def measure(results, scale, stage, trace_memory, func, *args):
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    # The pipeline prints per guid; keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        output = func(*args)
+    seconds = time.perf_counter() - start
+    peak_mb = None
+    if trace_memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    results.append({'scale': scale, 'stage': stage, 'seconds': round(seconds, 4),
+                    'peak_mb': round(peak_mb, 1) if peak_mb is not None else None})
+    return output
+
+# Run the same stages, in the same order, as parse_mds_response
+def bench_scale(scale, base, trace_memory=True, seed=0):
+    results = []
+    records = generate_mds(int(base * scale), seed=seed)
+    metadata, _, _ = measure(results, scale, 'flatten', trace_memory, prep.gather_metadata, records)
+    del records
+    df1, df2, df3, df4 = measure(results, scale, 'transform_data', trace_memory, prep.transform_metadata, metadata)
+    res_df1, res_df3, res_df4 = measure(results, scale, 'project_studies', trace_memory, prep.project_studies, df1, df3, df4)
+    complxn_stats = measure(results, scale, 'cedar_completion', trace_memory, prep.cedar_completion, df1)
+    final_df = measure(results, scale, 'merge', trace_memory, prep.combine_frames, res_df1, res_df3, res_df4, complxn_stats)
+    insert_df = measure(results, scale, 'typed_output', trace_memory, prep.prepare_output, final_df)
+    measure(results, scale, 'overrides', trace_memory, prep.apply_rules, insert_df)
+    return results
+
+# The whole parse, serial and sharded, to see how it scales with processes
+def bench_workers(scale, base, workers, seed=0):
+    results = []
+    records = generate_mds(int(base * scale), seed=seed)
+    for count in [1] + workers:
+        # gather_metadata flattens the records in place, so every run gets its own copy
+        measure(results, scale, f'parse x{count}', False, prep.parse_mds_response, copy.deepcopy(records), False, None, count)
+    return results
+
+def print_results(results):
+    print(f"{'scale':>6} {'stage':<18} {'seconds':>10} {'peak MB':>9}")
+    for row in results:
+        peak = f"{row['peak_mb']:.1f}" if row['peak_mb'] is not None else '-'
+        print(f"{row['scale']:>5}x {row['stage']:<18} {row['seconds']:>10.4f} {peak:>9}")
+
+# Stages that got slower than `tolerance` times the saved baseline
+def regressions(results, baseline, tolerance):
+    saved = {(row['scale'], row['stage']): row['seconds'] for row in baseline}
+    slower = []
+    for row in results:
+        before = saved.get((row['scale'], row['stage']))
+        if before and row['seconds'] > before * tolerance:
+            slower.append(f"{row['scale']}x {row['stage']}: {before:.4f}s -> {row['seconds']:.4f}s")
+    return slower
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark parse_mds_response on synthetic MDS catalogs')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100], help='multiples of --base guids')
+    parser.add_argument('--base', type=int, default=BASE_GUID_COUNT, help='guid count at scale 1')
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc (it slows every stage down)')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    parser.add_argument('--workers', type=int, nargs='*', default=[], help='also time sharded parses with these process counts')
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        scale = int(scale) if scale == int(scale) else scale
+        results.extend(bench_scale(scale, args.base, trace_memory=not args.no_memory))
+        if args.workers:
+            results.extend(bench_workers(scale, args.base, args.workers))
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if slower else 0)
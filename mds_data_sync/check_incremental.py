@@ -0,0 +1,96 @@
+import io
+import copy
+import argparse
+import tempfile
+import contextlib
+import pandas as pd
+from mds_data_prep import prepare_records
+from mds_synthetic import generate_mds
+from sync_state import SyncState
+from lambda_function import records_to_parse
+
+# Check that incremental syncs leave the table as a full rebuild would
+#
+# Usage: python check_incremental.py [--guids 300]
+# Syncs a synthetic catalog in full, then edits it and syncs it again through the lambda's incremental path
+# (sync state, delta, catalog check, partial parse), applying each run to an in-memory table the way
+# write_changes applies it to MySQL. After every edit the table has to equal a full parse of the edited catalog.
+
+TARGET = 'check/incremental/progress_tracker'
+# Set by the sync at write time, so never equal between two runs
+VOLATILE_COLUMNS = ['date_last_mds_update']
+
+def parse(records, catalog=None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return prepare_records(records, catalog=catalog)
+
+# One sync of `mds` against `table`; returns the new table and whether the run was a full rebuild
+def sync(state, mds, table):
+    delta = state.start_delta(TARGET)
+    # The parse edits the records it is given, so every load is a fresh copy, as a fetch would be
+    loads = []
+    delta, records, catalog = records_to_parse(state, TARGET, delta, lambda: loads.append(1) or copy.deepcopy(mds))
+    assert len(loads) == 1, "the catalog was loaded more than once"
+    if delta.is_empty():
+        state.commit(delta, TARGET)
+        return table, False
+    rows = parse(records, catalog)
+    if delta.full:
+        table = rows
+    else:
+        # A run that only removed guids parses no rows, but still has every column to write (see diff_write)
+        kept = table[~table['hdp_id'].isin(delta.stale)]
+        table = pd.concat([kept, rows[table.columns]], ignore_index=True) if len(rows) else kept[rows.columns]
+    state.commit(delta, TARGET)
+    return table, delta.full
+
+def comparable(df):
+    df = df.drop(columns=VOLATILE_COLUMNS).sort_values('hdp_id', ignore_index=True)
+    return df.astype(object).where(df.notna(), None)
+
+# Edits of the catalog, each with whether it has to rebuild the whole table
+def edit_values(mds):
+    guids = list(mds)
+    for guid in guids[5::7]:
+        section = mds[guid]['gen3_discovery']['study_metadata']['data_availability']
+        section['produce_data'] = '' if section['produce_data'] else 'Yes'
+    mds[guids[3]]['gen3_discovery']['is_registered'] = not mds[guids[3]]['gen3_discovery']['is_registered']
+
+def remove_and_add(mds):
+    guids = list(mds)
+    del mds[guids[4]]
+    guid = guids[6]
+    record = copy.deepcopy(mds[guid])
+    record['gen3_discovery']['_hdp_uid'] = f'{guid}9'
+    mds[f'{guid}9'] = record
+
+def remove_only(mds):
+    del mds[list(mds)[8]]
+
+def new_field(mds):
+    guid = list(mds)[10]
+    mds[guid]['gen3_discovery']['study_metadata']['study_type']['study_new_field'] = 'Yes'
+
+def first_cedar_update(mds):
+    gen3_discovery = next(iter(mds.values()))['gen3_discovery']
+    gen3_discovery['time_of_last_cedar_updated'] = '2025-01-02T03:04:05'
+
+EDITS = [(edit_values, False), (remove_and_add, False), (remove_only, False), (new_field, True), (first_cedar_update, True)]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that incremental syncs match a full rebuild')
+    parser.add_argument('--guids', type=int, default=300)
+    args = parser.parse_args()
+
+    mds = generate_mds(args.guids)
+    with tempfile.NamedTemporaryFile(suffix='.sqlite') as f:
+        state = SyncState(f.name)
+        table, _ = sync(state, mds, None)
+        for edit, rebuilds in EDITS:
+            edit(mds)
+            table, full = sync(state, mds, table)
+            expected = parse(copy.deepcopy(mds))
+            assert full == rebuilds, f"{edit.__name__}: {'full rebuild' if full else 'incremental sync'} was not expected"
+            pd.testing.assert_frame_equal(comparable(table), comparable(expected), check_dtype=False)
+            print(f"{edit.__name__:<20} {'full' if full else 'incremental':<12} {len(table)} rows identical to a full rebuild")
+        state.close()
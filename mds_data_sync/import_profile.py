@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import argparse
+import importlib.util
+import subprocess
+from collections import defaultdict
+
+# Import cost of each Lambda entry point, package by package
+#
+# Usage: python import_profile.py [--entries sync api] [--runs 5] [--top 15] [--json out.json] [--baseline old.json --tolerance 1.5]
+# Every entry point is imported in a fresh interpreter under `python -X importtime`, `--runs` times, and the fastest run
+# is kept (the first one also pays for writing .pyc files). Modules a bare interpreter already loads are left out.
+# Reports the entry point's total import time and, per top-level package, the time spent importing its modules and its
+# size on disk. Fails when a thin entry point imports one of its excluded packages, and with --baseline when an entry
+# point got more than `tolerance` times slower to import than the saved results.
+
+SYNC_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(os.path.dirname(SYNC_DIR), 'mds_api_service')
+
+# name -> (directory, modules imported, packages the entry point must not import)
+# 'sync' is what every sync invocation loads; 'sync_write' adds what lambda_function.write_changes imports
+# the first time a run has changes to write
+ENTRY_POINTS = {
+    'sync': (SYNC_DIR, ['lambda_function'], ['pandas', 'numpy', 'mysql', 'sqlalchemy']),
+    'sync_write': (SYNC_DIR, ['lambda_function', 'mds_data_prep', 'mysql_pool', 'post_load_rules', 'progress_tracker_loader', 'study_documents'], ['sqlalchemy']),
+    'api': (API_DIR, ['query_progress_tracker_table'], ['pandas', 'numpy', 'sqlalchemy']),
+}
+
+# (module, self us, cumulative us, nesting level) for every line of `-X importtime` output
+def parse_importtime(stderr):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), level))
+    return rows
+
+def importtime(directory, code):
+    path = os.pathsep.join(filter(None, [directory, os.getenv('PYTHONPATH')]))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=directory,
+                            capture_output=True, text=True, env={**os.environ, 'PYTHONPATH': path})
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f'exit code {result.returncode}')
+    return parse_importtime(result.stderr)
+
+# Size on disk of a top-level package (or single-file module) as found from `directory`
+def package_size(name, directory):
+    sys.path.insert(0, directory)
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        spec = None
+    finally:
+        sys.path.remove(directory)
+    if spec is None:
+        return None
+    if spec.submodule_search_locations:
+        return sum(os.path.getsize(os.path.join(root, file))
+                   for location in spec.submodule_search_locations
+                   for root, _, files in os.walk(location) for file in files)
+    if spec.origin and os.path.isfile(spec.origin):
+        return os.path.getsize(spec.origin)
+    return 0
+
+def profile_entry(name, runs, startup):
+    directory, modules, excluded = ENTRY_POINTS[name]
+    result = {'entry': name, 'modules': modules}
+    try:
+        best = min((importtime(directory, f"import {', '.join(modules)}") for _ in range(runs)),
+                   key=lambda rows: sum(cumulative for _, _, cumulative, level in rows if level == 0))
+    except RuntimeError as e:
+        result['error'] = str(e)
+        return result
+
+    rows = [row for row in best if row[0] not in startup]
+    packages = defaultdict(int)
+    for module, self_us, _, _ in rows:
+        packages[module.split('.')[0]] += self_us
+    result['total_ms'] = round(sum(cumulative for _, _, cumulative, level in rows if level == 0) / 1000, 1)
+    result['module_count'] = len(rows)
+    result['packages'] = [{'package': package, 'ms': round(us / 1000, 1), 'size_kb': size and round(size / 1024)}
+                          for package, us in sorted(packages.items(), key=lambda item: -item[1])
+                          for size in [package_size(package, directory)]]
+    result['excluded_imported'] = [package for package in excluded if package in packages]
+    return result
+
+def print_results(results, top):
+    for result in results:
+        if 'error' in result:
+            print(f"{result['entry']}: could not import {', '.join(result['modules'])}: {result['error']}\n")
+            continue
+        print(f"{result['entry']}: {result['total_ms']:.1f} ms, {result['module_count']} modules")
+        print(f"  {'package':<28} {'ms':>8} {'size KB':>9}")
+        for row in result['packages'][:top]:
+            size = row['size_kb'] if row['size_kb'] is not None else '-'
+            print(f"  {row['package']:<28} {row['ms']:>8.1f} {size:>9}")
+        if result['excluded_imported']:
+            print(f"  imports excluded packages: {', '.join(result['excluded_imported'])}")
+        print()
+
+# Entry points that got slower than `tolerance` times the saved baseline
+def regressions(results, baseline, tolerance):
+    saved = {row['entry']: row.get('total_ms') for row in baseline}
+    slower = []
+    for row in results:
+        before = saved.get(row['entry'])
+        if before and row.get('total_ms') and row['total_ms'] > before * tolerance:
+            slower.append(f"{row['entry']}: {before:.1f} ms -> {row['total_ms']:.1f} ms")
+    return slower
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profile the import cost of the Lambda entry points')
+    parser.add_argument('--entries', nargs='+', choices=list(ENTRY_POINTS), default=list(ENTRY_POINTS))
+    parser.add_argument('--runs', type=int, default=5, help='imports per entry point; the fastest is kept')
+    parser.add_argument('--top', type=int, default=15, help='packages listed per entry point')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    args = parser.parse_args()
+
+    startup = {module for module, _, _, _ in importtime(SYNC_DIR, 'pass')}
+    results = [profile_entry(name, args.runs, startup) for name in args.entries]
+    print_results(results, args.top)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    failures = [f"{row['entry']} could not be imported: {row['error']}" for row in results if 'error' in row]
+    failures += [f"{row['entry']} imports {', '.join(row['excluded_imported'])}" for row in results if row.get('excluded_imported')]
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures += [f"REGRESSION {line}" for line in regressions(results, json.load(f), args.tolerance)]
+    for line in failures:
+        print(line)
+    sys.exit(1 if failures else 0)
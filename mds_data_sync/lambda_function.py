@@ -1,83 +1,195 @@
 import os
 import json
-from sqlalchemy import create_engine
-import mysql.connector
-from dotenv import load_dotenv
 import logging
-from mds_data_prep import mds_data_prep
+from dotenv import load_dotenv
+from sync_state import SyncState, DEFAULT_STATE_PATH
+from sync_metrics import SyncMetrics
+from mds_source import load_mds_records
 
+# Cold start: only what every invocation needs is imported with the module. mysql.connector (through
+# mysql_pool) is imported by the handler to read the table's data version, and pandas and numpy (through
+# mds_data_prep, the loader and the rules) by write_changes the first time a run has something to write,
+# so an incremental run that finds no changes never loads them. `python import_profile.py` reports the
+# import cost of each entry point
+
+# LOG_LEVEL=DEBUG brings back the per-guid detail from mds_data_prep
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.getenv('LOG_LEVEL', 'INFO'))
 
 # https://docs.aws.amazon.com/lambda/latest/dg/python-package.html
 
 def lambda_handler(event, context):
 
-    # Pull data from MDS, and prepare for MySQL upload
-    insert_df = mds_data_prep(local=False)
-
-    # MySQL connection parameters
     # Load environment variables from .env file
+    # (MDS_URL / MDS_PAGE_SIZE / MDS_MAX_WORKERS are read by mds_source)
     load_dotenv()
 
+    # MySQL connection parameters
+
     # Accessing variables
-    db_username = os.getenv('DB_USER')
-    db_password = os.getenv('DB_PASSWORD')
     db_host = os.getenv('DB_HOST')
     db_database = os.getenv('DB_NAME')
     table_name = os.getenv('TABLE_NAME')
 
-    # Drop existing records
-    connection = mysql.connector.connect(
-        host=db_host,
-        database=db_database,
-        user=db_username,
-        password=db_password
-    )
-    cursor = connection.cursor()
-    # SQLAlchemy engine for MySQL
-    engine_url = f'mysql+pymysql://{db_username}:{db_password}@{db_host}/{db_database}'
-    engine = create_engine(engine_url)
-
-    # Insert DataFrame into MySQL table
-    try:
-        insert_df.to_sql(table_name, con=engine, if_exists='replace', index=False)
-        print("Success!")
-    except sqlalchemy.exc.SQLAlchemyError as e:
-        print(f'Unsuccessful insert. Error: {e}')
+    # Incremental sync: only guids added, changed or removed since the last successful run are parsed and written
+    # A full rebuild happens with SYNC_MODE=full, {"full_rebuild": true} in the event, or when no state is stored yet
+    full_rebuild = os.getenv('SYNC_MODE', 'incremental') == 'full' or bool((event or {}).get('full_rebuild'))
+    sync_target = f'{db_host}/{db_database}/{table_name}'
+    sync_state = SyncState(os.getenv('SYNC_STATE_PATH', DEFAULT_STATE_PATH))
+
+    # Every stage is timed and the run summary is returned in the response
+    metrics = SyncMetrics()
+
+    # The table's data version tells whether another container wrote it since this one's state (see
+    # SyncState.start_delta); a run with no changes makes no other MySQL query, and needs only mysql.connector
+    with metrics.span('db_version'):
+        from mysql_pool import read_data_version
+        data_version = read_data_version(table_name, allow_local_infile=os.getenv('SYNC_LOAD_METHOD', 'insert') == 'infile')
+    delta = sync_state.start_delta(sync_target, full_rebuild=full_rebuild, data_version=data_version)
+
+    # Pull data from MDS and keep the guids that were added or changed
+    delta, records, catalog = records_to_parse(sync_state, sync_target, delta, lambda: load_mds_records(metrics=metrics))
+    if delta.is_empty():
+        # Nothing added, changed or removed: no parse, no database, no pandas
+        print("No changes since last sync")
+        sync_state.commit(delta, sync_target)
+        sync_state.close()
+        assertions = []
+    else:
+        assertions = write_changes(records, delta, sync_state, sync_target, table_name, metrics, catalog)
+    print(f"**** Sync delta: {delta.summary()}")
 
-    # Update non-registered studies to have 0% completion
-    try:
-        cursor.execute(f"update {table_name} set overall_percent_complete='0' where is_registered ='not registered';")
-        connection.commit()  # Commit the transaction to apply the changes
-        print("unregistered studies zeroed out")
-    except mysql.connector.Error as err:
-        print("unsuccessful update, error:", err)
+    response = {
+        'statusCode': 200,
+        'result': json.dumps(assertions, indent=4, default=str),
+        'sync': delta.summary(),
+        'metrics': metrics.summary()
+        }
+    return response
+
+# The records `delta` lets through, from `load_records()`; returns (delta, records, catalog)
+# Every study's completion depends on the whole catalog (the CEDAR fields any study has and the first study's
+# cedar update, see SyncDelta.catalog), so an incremental run reads the changed records ahead until all of it
+# has been seen, and parses them with that catalog. When it changed since the table was written, the rows the
+# run would not re-parse are out of date too, and the run becomes a full rebuild of the records already loaded,
+# which the incremental run keeps until then rather than fetching the MDS a second time
+def records_to_parse(sync_state, sync_target, delta, load_records):
+    if delta.full:
+        return delta, delta.filter_records(load_records()), None
+    loaded = load_records()
+    loaded = list(loaded.items() if isinstance(loaded, dict) else loaded)
+    records = list(delta.filter_records(loaded))
+    if delta.catalog == sync_state.catalog():
+        return delta, records, delta.catalog
+    print("CEDAR fields or first cedar update changed since the last sync; rebuilding the whole table")
+    delta = sync_state.start_delta(sync_target, full_rebuild=True, data_version=delta.data_version)
+    return delta, delta.filter_records(loaded), None
+
+# Parse the changed records, prepare them for MySQL and write them; returns the post-load assertion results
+def write_changes(records, delta, sync_state, sync_target, table_name, metrics, catalog=None):
+    # Imported here rather than with the module (see above); after the first call they come from sys.modules
+    with metrics.span('imports'):
+        import mysql.connector
+        from mds_data_prep import prepare_records
+        from mysql_pool import get_connection
+        from post_load_rules import run_assertions, load_assertions, assertion_columns, table_frame
+        from progress_tracker_loader import swap_load, bulk_insert, diff_write, missing_columns, stamp_data_version, load_settings
+        from study_documents import rebuild_documents, drop_documents, documents_enabled
+
+    # Post-load assertions (see post_load_rules.py; SYNC_ASSERTIONS configures them), read and checked
+    # before anything is parsed or written
+    checks = load_assertions()
+
+    # Prepare for MySQL upload
+    insert_df = prepare_records(records, metrics=metrics, catalog=catalog)
 
+    # Drop existing records
+    with metrics.span('db_connect'):
+        # The connection comes from the container's pool (see mysql_pool.py): a warm invocation reuses the
+        # previous one after a ping instead of opening a new one
+        # SYNC_LOAD_METHOD=infile loads with LOAD DATA LOCAL INFILE, which the connection has to allow
+        load_method, insert_batch, write_mode = load_settings()
+        connection, new_pool = get_connection(allow_local_infile=load_method == 'infile')
+        metrics.count('db_pool', 'created' if new_pool else 'reused')
 
-    # Update non-registered studies to have 0% completion
+    # Insert DataFrame into MySQL table
+    cursor = None
     try:
-        cursor.execute(f"select appl_id, is_registered, overall_percent_complete  from progress_tracker where appl_id in ('10056337', '9608089', '9867358', '9900258', '10320676', '9839124', '10304570');")
-        # Fetch the results
-        rows = cursor.fetchall()
-
-        # Get column names
-        column_names = [column[0] for column in cursor.description]
-
-        # Convert results to a list of dictionaries
-        results = [dict(zip(column_names, row)) for row in rows]
-
-        # Convert to JSON and pretty print
-        print(json.dumps(results, indent=4))
-
-    except mysql.connector.Error as err:
-        print("unsuccessful update, error:", err)
-
+        cursor = connection.cursor()
+        with metrics.span('db_write') as span:
+            span.set_frames(insert_df)
+            try:
+                if delta.full and insert_df.empty:
+                    raise ValueError("no rows parsed for a full rebuild; keeping the existing table")
+                # A table from before a schema change (no row_hash or normalized identifier columns yet) can only
+                # be migrated by a full rebuild, which recreates it from the typed schema
+                missing = missing_columns(cursor, table_name, insert_df.columns)
+                if missing and not delta.full:
+                    raise ValueError(f"{table_name} has no column(s) {', '.join(missing)}; run a full rebuild (SYNC_MODE=full)")
+                # SYNC_WRITE_MODE=diff only sends the rows whose row_hash changed; it needs a table that already
+                # has every column, so the first full rebuild (or SYNC_WRITE_MODE=swap) goes through swap_load
+                diff = write_mode == 'diff' and not missing
+                if delta.full and diff:
+                    changes = diff_write(connection, table_name, insert_df, batch_rows=insert_batch)
+                elif delta.full:
+                    # Bulk load a staging table built from the typed schema and swap it in atomically,
+                    # so readers see either the old table or the complete new one
+                    swap_load(connection, table_name, insert_df, method=load_method, batch_rows=insert_batch)
+                    changes = None
+                elif diff:
+                    changes = diff_write(connection, table_name, insert_df, removed=delta.stale, batch_rows=insert_batch)
+                else:
+                    # Drop the rows of changed and removed guids and insert the re-parsed ones in one transaction
+                    stale = delta.stale
+                    for start in range(0, len(stale), 1000):
+                        batch = stale[start:start + 1000]
+                        cursor.execute(f"delete from {table_name} where hdp_id in ({', '.join(['%s'] * len(batch))});", batch)
+                    if not insert_df.empty:
+                        bulk_insert(cursor, table_name, insert_df, batch_rows=insert_batch)
+                    connection.commit()
+                    changes = None
+                if changes is not None:
+                    metrics.count('db_changes', changes)
+                # A differential write that changed nothing keeps the current documents and data version, unless
+                # an earlier run wrote rows and failed before publishing them
+                if changes is None or changes['inserted'] or changes['updated'] or changes['deleted']:
+                    sync_state.set_publish_pending(sync_target, True)
+                if sync_state.publish_pending(sync_target):
+                    # The query API's pre-rendered responses (see study_documents.py) are rendered again before the
+                    # new data version is stamped, so nothing cached under the new version comes from the old ones
+                    with metrics.span('documents'):
+                        if documents_enabled():
+                            metrics.count('documents', rebuild_documents(connection, table_name, batch_rows=insert_batch))
+                        else:
+                            drop_documents(connection, table_name)
+                    # A new data version tells the query API to drop its cached responses
+                    delta.data_version = stamp_data_version(connection, table_name)
+                    metrics.count('data_version', delta.data_version)
+                    sync_state.set_publish_pending(sync_target, False)
+                sync_state.commit(delta, sync_target)
+                print("Success!")
+            except (ValueError, mysql.connector.Error) as e:
+                connection.rollback()
+                print(f'Unsuccessful insert. Error: {e}')
+            finally:
+                sync_state.close()
+
+        # The assertions run on the rows of this sync in memory, or on the whole table after an incremental
+        # sync, which only parsed the changed rows. The 0% completion of non-registered studies is already
+        # applied as an override in mds_data_prep, before the rows were written
+        with metrics.span('assertions'):
+            if delta.full:
+                checked = insert_df
+            else:
+                columns = assertion_columns(checks)
+                absent = set(missing_columns(cursor, table_name, columns))
+                checked = table_frame(cursor, table_name, [column for column in columns if column not in absent])
+            assertions = run_assertions(checked, checks)
+            print(json.dumps(assertions, indent=4, default=str))
     finally:
-        cursor.close()
+        # Whatever the error, the connection goes back to the pool for the next warm invocation
+        if cursor is not None:
+            cursor.close()
+        connection.close()
 
-    response = {
-        'statusCode': 200,
-        'result': json.dumps(results, indent=4)
-        }
-    return response
\ No newline at end of file
+    return assertions
@@ -1,12 +1,19 @@
+import os
+import sys
 import logging
 from mds_data_prep import mds_data_prep
 
+# Stage spans are logged at INFO; LOG_LEVEL=DEBUG adds the per-guid detail
+logging.basicConfig(format='%(message)s')
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.getenv('LOG_LEVEL', 'INFO'))
 
 # https://docs.aws.amazon.com/lambda/latest/dg/python-package.html
 
+# Usage: python lambda_function_local.py [snapshot]
+# With a snapshot ('latest', a sha256 prefix, a timestamp or a file path) the pipeline
+# is replayed from the MDS snapshot cache without any network access
 def lambda_handler(event, context):
-    insert_df = mds_data_prep(local=True)
+    insert_df = mds_data_prep(local=True, snapshot=(event or {}).get('snapshot'))
 
-lambda_handler(None, None)
\ No newline at end of file
+lambda_handler({'snapshot': sys.argv[1]} if len(sys.argv) > 1 else None, None)
\ No newline at end of file
@@ -1,58 +1,125 @@
+import os
+import sys
+import logging
+import traceback
+import multiprocessing
 import pandas as pd
 import numpy as np
 import json
 from datetime import datetime
-import requests
+from mds_source import load_mds_records
+from sync_metrics import SyncMetrics
+from study_metadata_schema import StudyMetadataFlattener, NONCEDAR
+from progress_tracker_schema import PROGRESS_TRACKER_COLUMNS, ROW_HASH_COLUMN, typed_output, row_hashes
+from post_load_rules import apply_overrides
+
+# Per-guid detail is logged at DEBUG (LOG_LEVEL=DEBUG); stage timings come from sync_metrics spans
+logger = logging.getLogger(__name__)
  
 # Create a function to clean the metadata so that all unfilled dictionaries or lists are seen as NaN
 # leave empty strings as `''`
+# Works a column at a time: dicts whose values are all falsy and empty lists become NaN; bools, numbers,
+# strings and anything else are left alone. Non-object columns cannot hold a dict or list and are skipped.
 def clean_data(df):
     for col in df.columns:
-        for i in range(len(df)):
-            if type(df[col].iloc[i]) == bool or type(df[col].iloc[i]) == np.bool_:
-                continue
-            elif type(df[col].iloc[i]) == dict:
-                if not any(list(df[col].iloc[i].values())):
-                    df.at[i, col]= np.nan
-            elif type(df[col].iloc[i]) == int or type(df[col].iloc[i]) == np.float64 or type(df[col].iloc[i]) == float:
-                continue
-            elif type(df[col].iloc[i]) == list:
-                if len(df[col].iloc[i]) == 0:
-                    df.at[i, col]= np.nan
+        if df[col].dtype != object:
+            continue
+        values = df[col].to_numpy()
+        empty = np.fromiter(
+            ((type(value) is dict and not any(value.values())) or (type(value) is list and len(value) == 0) for value in values),
+            dtype=bool, count=len(values))
+        if empty.any():
+            values = values.copy()
+            values[empty] = np.nan
+            df[col] = values
     return df
 
+# Columns read by the per-study projections in parse_mds_response
+# A partial (incremental) parse may not see every key, so missing ones are added as NaN
+GEN3_COLUMNS = ['project_title', 'project_number', 'investigators_name', 'guid_type', 'is_registered',
+                'time_of_registration', 'registrant_username', 'archive_date', 'year_awarded', 'data_linked',
+                'gen3_data_availability',
+                'cedar_study_metadata.metadata_location.nih_reporter_link',
+                'cedar_study_metadata.metadata_location.clinical_trials_study_ID',
+                'cedar_study_metadata.metadata_location.clinical_trials_study_link',
+                'cedar_study_metadata.metadata_location.data_repositories',
+                'cedar_study_metadata.metadata_location.other_study_websites']
+NIH_COLUMNS = ['appl_id', 'award_type', 'award_amount', 'award_notice_date', 'project_end_date', 'project_title']
+VLMD_COLUMNS = ['vlmd_available', 'data_dictionaries', 'common_data_elements']
+
+# gen3_discovery keys kept by gather_metadata besides the flattened study_metadata and the ones it derives;
+# the rest of each record (manifests, tags, the clinicaltrials.gov section, ...) is let go as soon as it is read,
+# so a streamed parse only holds on to what the frames are built from
+GEN3_KEYS = ['project_title', 'project_number', 'investigators_name', 'is_registered', 'time_of_registration',
+             'registrant_username', 'archive_date', 'year_awarded', 'time_of_last_cedar_updated']
+
+def subset(mapping, keys):
+    return {key: mapping[key] for key in keys if key in mapping}
+
+# Columns of the progress_tracker table, in order
+OUTPUT_COLUMNS = PROGRESS_TRACKER_COLUMNS
+
+def ensure_columns(df, columns):
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        df = df.reindex(columns=list(df.columns) + missing)
+    return df
+
+# Store one column's values with a typed dtype when every value allows it (all bools, all ints, or
+# floats/NaN); anything mixed, missing-with-ints, strings or containers stays object, as before
+def column_values(values):
+    kinds = set(map(type, values))
+    if kinds == {bool}:
+        return np.array(values, dtype=bool)
+    if kinds == {int}:
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            pass
+    if kinds == {float}:
+        return np.array(values, dtype=np.float64)
+    column = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        column[i] = value
+    return column
+
+# Build the guid -> record mapping straight into a row-per-guid frame
+# The key union is computed once in first-seen order (the order DataFrame.from_dict(...).T gave),
+# and keys a record lacks are NaN, so this replaces the old from_dict + transpose without the copy
+def build_frame(meta_dict, index_name='guids'):
+    records = list(meta_dict.values())
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    missing = np.nan
+    data = {index_name: column_values(list(meta_dict.keys()))}
+    for col in columns:
+        data[col] = column_values([record.get(col, missing) for record in records])
+    return pd.DataFrame(data, columns=[index_name] + columns)
+
 # Create a function to transform the metadata to a dataframe format
 # Use the clean_data function during transformation
 def transform_data(meta_dict):
-    df = pd.DataFrame.from_dict(meta_dict)
-    df = df.T
-    df.index.name = 'guids'
-    df.reset_index(inplace=True)
+    df = build_frame(meta_dict)
     df = clean_data(df)
     return df
 
-## Function to parse the gen3_discovert
-def parse_mds_response(response_json, write_to_disk=False):
-
-    bool_string = lambda x: 'Yes' if x else 'No'
-
-    ####################################################################################
-    ### Gather metadata into useful form
-    ####################################################################################
+def bool_string(x):
+    return 'Yes' if x else 'No'
+
+####################################################################################
+### Gather metadata into useful form
+####################################################################################
+# Split each guid's record into the gen3 / clinicaltrials.gov / NIH RePORTER / VLMD mappings,
+# flattening gen3_discovery.study_metadata into `cedar_study_metadata.*` / `study_metadata.*` keys
+# (see study_metadata_schema.py; pass a `flattener` to read its schema drift report afterwards)
+# Only the fields the frames read are kept from each record (see GEN3_KEYS); `manifests` also keeps each
+# study's manifest in study_cnt, which is only written out locally
+def gather_metadata(response_json, flattener=None, manifests=True):
     print(f">>> Gather metadata into useful form")
-    cedar_fields = ["data",
-                    "study_type",
-                    "minimal_info",
-                    "data_availability",
-                    "metadata_location",
-                    "study_translational_focus",
-                    "human_subject_applicability",
-                    "human_condition_applicability",
-                    "human_treatment_applicability",
-                    "time_of_registration",
-                    "time_of_last_cedar_updated"]
-
-    guids = response_json.keys()
+    flattener = flattener or StudyMetadataFlattener()
+
+    # response_json is either the full guid -> record mapping or an iterator of (guid, record) pairs
+    # (see mds_fetch.iter_mds); records are only read once so a stream never has to be held in memory
+    records = response_json.items() if isinstance(response_json, dict) else response_json
 
     metadata = {'nih_metadata': {}, 'ctgov_metadata': {}, 'gen3_metadata': {}, 'vlmd_metadata': {}}
 
@@ -60,469 +127,512 @@ def parse_mds_response(response_json, write_to_disk=False):
     cnt = 0
     study_cnt = []
 
-    for guid in guids:
+    for guid, record in records:
 
         is_gen3_discovery_datatype = False
         is_repository_study_link = False
         is_manifest = False
-        if 'gen3_discovery' in response_json[guid].keys():
-            metadata['gen3_metadata'][guid] = response_json[guid]['gen3_discovery'] # get majority metadata
+        if 'gen3_discovery' in record.keys():
+            metadata['gen3_metadata'][guid] = subset(record['gen3_discovery'], GEN3_KEYS) # get majority metadata
 
-            is_manifest = (len(response_json[guid]['gen3_discovery']['__manifest']) > 0) if '__manifest' in response_json[guid]['gen3_discovery'] else False
+            is_manifest = (len(record['gen3_discovery']['__manifest']) > 0) if '__manifest' in record['gen3_discovery'] else False
             
             metadata['gen3_metadata'][guid]['data_linked'] = bool_string(is_manifest)
 
-            if '_guid_type' in response_json[guid].keys():
-                metadata['gen3_metadata'][guid]['guid_type'] = response_json[guid]['_guid_type'] # get registration status
-                is_gen3_discovery_datatype = response_json[guid]['_guid_type'] in ["discovery_metadata", "unregistered_discovery_metadata"]
+            if '_guid_type' in record.keys():
+                metadata['gen3_metadata'][guid]['guid_type'] = record['_guid_type'] # get registration status
+                is_gen3_discovery_datatype = record['_guid_type'] in ["discovery_metadata", "unregistered_discovery_metadata"]
                 
-            if 'study_metadata' in response_json[guid]['gen3_discovery'].keys():
-                for key1 in response_json[guid]['gen3_discovery']['study_metadata'].keys():
-                    for key2 in response_json[guid]['gen3_discovery']['study_metadata'][key1].keys():
-                        if key1 in cedar_fields:
-                            metadata['gen3_metadata'][guid][f'cedar_study_metadata.{key1}.{key2}'] = response_json[guid]['gen3_discovery']['study_metadata'][key1][key2]
-                        else:
-                            metadata['gen3_metadata'][guid][f'study_metadata.{key1}.{key2}'] = response_json[guid]['gen3_discovery']['study_metadata'][key1][key2]
+            if 'study_metadata' in record['gen3_discovery'].keys():
+                # Only the CEDAR sections are read from the flattened study_metadata (completion and the metadata location)
+                flattened = flattener.flatten(record['gen3_discovery']['study_metadata'], {})
+                metadata['gen3_metadata'][guid].update((key, value) for key, value in flattened.items() if key.startswith('cedar_study_metadata.'))
                 repository_study_link = ''
-                if 'metadata_location' in response_json[guid]['gen3_discovery']['study_metadata'] and \
-                    'data_repositories' in response_json[guid]['gen3_discovery']['study_metadata']['metadata_location'] and \
-                        len(response_json[guid]['gen3_discovery']['study_metadata']['metadata_location']['data_repositories']) > 0:
-                    print(f"**** Data repositories present for guid {guid}")
-                    is_repository_study_link = len(response_json[guid]['gen3_discovery']['study_metadata']['metadata_location']['data_repositories'][0].get('repository_study_link','')) > 0
+                if 'metadata_location' in record['gen3_discovery']['study_metadata'] and \
+                    'data_repositories' in record['gen3_discovery']['study_metadata']['metadata_location'] and \
+                        len(record['gen3_discovery']['study_metadata']['metadata_location']['data_repositories']) > 0:
+                    logger.debug("**** Data repositories present for guid %s", guid)
+                    is_repository_study_link = len(record['gen3_discovery']['study_metadata']['metadata_location']['data_repositories'][0].get('repository_study_link','')) > 0
                     if is_repository_study_link:
-                        repository_study_link = response_json[guid]['gen3_discovery']['study_metadata']['metadata_location']['data_repositories'][0].get('repository_study_link', '')
-                        print(f"REpository study link for {guid} is {repository_study_link}")
-                del metadata['gen3_metadata'][guid]['study_metadata']
+                        repository_study_link = record['gen3_discovery']['study_metadata']['metadata_location']['data_repositories'][0].get('repository_study_link', '')
+                        logger.debug("Repository study link for %s is %s", guid, repository_study_link)
             
-            gen3_data_availability = response_json[guid]['gen3_discovery']['data_availability'] if 'data_availability' in response_json[guid]['gen3_discovery'].keys() else ''
+            gen3_data_availability = record['gen3_discovery']['data_availability'] if 'data_availability' in record['gen3_discovery'].keys() else ''
             metadata['gen3_metadata'][guid]['gen3_data_availability'] = gen3_data_availability
-            if 'data_availability' in response_json[guid]['gen3_discovery'].keys():
-                print(f"{guid}, {response_json[guid]['gen3_discovery']['data_availability']}")
+            if 'data_availability' in record['gen3_discovery'].keys():
+                logger.debug("%s, %s", guid, record['gen3_discovery']['data_availability'])
             
             cnt = cnt +  int( is_gen3_discovery_datatype and (is_manifest or is_repository_study_link ))
             if is_gen3_discovery_datatype or is_manifest or is_repository_study_link:
-                # print(response_json[guid]['gen3_discovery'])
+                # print(record['gen3_discovery'])
                 # print(is_repository_study_link)
                 study_cnt.append( {'guid':guid, 
-                                'guid_type': response_json[guid]['_guid_type'] if is_gen3_discovery_datatype else '', 
-                                 'manifest': response_json[guid]['gen3_discovery']['__manifest'] if  is_manifest else '', 
+                                'guid_type': record['_guid_type'] if is_gen3_discovery_datatype else '', 
+                                 'manifest': record['gen3_discovery']['__manifest'] if is_manifest and manifests else '', 
                                  'repository_study_link': repository_study_link if is_repository_study_link else '' })
 
             ## Set vlmd_metadata to a deafult set.
             metadata['vlmd_metadata'][guid]={'vlmd_available':False, 'data_dictionaries':[], 'common_data_element':{}}
 
-        if 'nih_reporter' in response_json[guid].keys():
-            metadata['nih_metadata'][guid] = response_json[guid]['nih_reporter']
+        if 'nih_reporter' in record.keys():
+            metadata['nih_metadata'][guid] = subset(record['nih_reporter'], NIH_COLUMNS)
 
-        if 'clinicaltrials_gov' in response_json[guid].keys():
-            metadata['ctgov_metadata'][guid] = response_json[guid]['clinicaltrials_gov']
+        # No clinicaltrials.gov field makes it into the table; the guid is still counted
+        if 'clinicaltrials_gov' in record.keys():
+            metadata['ctgov_metadata'][guid] = {}
         
-        if 'variable_level_metadata' in response_json[guid].keys():
-            metadata['vlmd_metadata'][guid] = response_json[guid]['variable_level_metadata']
-            tags = response_json[guid]['gen3_discovery']['tags'] if ('gen3_discovery' in response_json[guid].keys() and 'tags' in response_json[guid]['gen3_discovery']) else []
+        if 'variable_level_metadata' in record.keys():
+            metadata['vlmd_metadata'][guid] = subset(record['variable_level_metadata'], VLMD_COLUMNS)
+            tags = record['gen3_discovery']['tags'] if ('gen3_discovery' in record.keys() and 'tags' in record['gen3_discovery']) else []
             is_jcoin = any([k['name'] == 'JCOIN' for k in tags])
             vlmd_guids[guid] = dict()
             vlmd_guids[guid]['is_jcoin'] = is_jcoin
-            vlmd_guids[guid]['dd_names'] = list(response_json[guid]['variable_level_metadata']['data_dictionaries']) if 'data_dictionaries' in response_json[guid]['variable_level_metadata'] else []
-            vlmd_guids[guid]['cdes'] = (response_json[guid]['variable_level_metadata']['common_data_elements']) if 'common_data_elements' in response_json[guid]['variable_level_metadata'] else []
+            vlmd_guids[guid]['dd_names'] = list(record['variable_level_metadata']['data_dictionaries']) if 'data_dictionaries' in record['variable_level_metadata'] else []
+            vlmd_guids[guid]['cdes'] = (record['variable_level_metadata']['common_data_elements']) if 'common_data_elements' in record['variable_level_metadata'] else []
             metadata['vlmd_metadata'][guid]['vlmd_available'] = is_gen3_discovery_datatype and ((len(vlmd_guids[guid]['dd_names']) > 0) or (len(vlmd_guids[guid]['cdes']) > 0))
 
     print(f"**** Number of studies with data : {cnt}")
 
-    if write_to_disk:
-        ## Print studies that have variable level metadata
-        with open('/tmp/vlmd_dump.json', 'w') as f:
-            jsonf = json.dumps(vlmd_guids, indent=4)
-            # write json object to file
-            f.write(jsonf)
-        pd.DataFrame.from_records(study_cnt, index='guid').to_excel('/tmp/studies_for_cnt.xlsx') 
+    return metadata, vlmd_guids, study_cnt
 
+# Build the gen3 (df1), clinicaltrials.gov (df2), NIH RePORTER (df3) and VLMD (df4) frames
+def transform_metadata(metadata):
     df1 = transform_data(metadata['gen3_metadata'])
     df2 = transform_data(metadata['ctgov_metadata'])
     df3 = transform_data(metadata['nih_metadata'])
     df4 = transform_data(metadata['vlmd_metadata'])
 
+    df1 = ensure_columns(df1, GEN3_COLUMNS)
+    df3 = ensure_columns(df3, NIH_COLUMNS)
+    df4 = ensure_columns(df4, VLMD_COLUMNS)
+
     df_apid = df3['appl_id']
     df1.drop(['appl_id'], axis=1, errors='ignore')
     df1 = pd.concat([df1, df_apid], axis=1)
-
-    ####################################################################################
-    ### Pull out relevant metadata
-    ####################################################################################
+    return df1, df2, df3, df4
+
+####################################################################################
+### Pull out relevant metadata
+####################################################################################
+# Investigator names as a list, stored in a JSON column as they are (apostrophes included)
+def investigator_names(value):
+    if isinstance(value, str):
+        return [value] if value else []
+    return list(value)
+
+# Python truthiness of every value, as `if value` would see it
+def truthy(column):
+    return column.map(bool).astype(bool)
+
+def yes_no(mask):
+    return pd.Series(np.where(mask, 'Yes', 'No'), index=mask.index, dtype=object)
+
+# One row per guid, the way groupby('guids') saw the frame: the first row of each guid,
+# rows without a guid dropped, sorted by guid
+def first_row_per_guid(df):
+    df = df[df['guids'].notna()].drop_duplicates('guids', keep='first')
+    return df.sort_values('guids', kind='stable').set_index('guids')
+
+def repository_metadata(data_repositories):
+    return [{'repository_name': repo.get('repository_name'),
+             'repository_study_ID': repo.get('repository_study_ID', ''),  # Default to empty string if key is missing
+             'repository_study_link': repo.get('repository_study_link', '')}  # Default to empty string if key is missing
+            for repo in data_repositories]
+
+# A field of the first listed data repository ('' when none are listed)
+def first_repository_field(data_repositories, key):
+    if data_repositories != '' and data_repositories:
+        return data_repositories[0].get(key, '')
+    return ''
+
+# Registration, archive and repository status from the gen3 metadata
+# Expects NaN already replaced with '' (see project_studies)
+def project_gen3(df1_null):
+    rows = first_row_per_guid(df1_null)
+    guid_type = rows['guid_type']
+    study_producing_data = guid_type.isin(['discovery_metadata', 'unregistered_discovery_metadata'])
+    archived = guid_type.eq('discovery_metadata_archive')
+    registered = truthy(rows['is_registered']) & guid_type.eq('discovery_metadata')
+
+    data_repositories = rows['cedar_study_metadata.metadata_location.data_repositories']
+    logger.debug("%s", data_repositories)
+    repository_name = data_repositories.map(lambda repos: first_repository_field(repos, 'repository_name'))
+    repository_study_id = data_repositories.map(lambda repos: first_repository_field(repos, 'repository_study_ID'))
+    repository_study_link = data_repositories.map(lambda repos: first_repository_field(repos, 'repository_study_link'))
+    gen3_data_availability = rows['gen3_data_availability']
+
+    return pd.DataFrame({
+        ### TODO contact pi name
+        'guid_type': guid_type,
+        'study_name': rows['project_title'].map(str).str.replace("'", "''", regex=False),
+        'project_num': rows['project_number'],
+        'investigators_name': rows['investigators_name'].map(investigator_names),
+        'is_registered': yes_no(registered),
+        'time_of_registration': rows['time_of_registration'].where(registered, ''),
+        'Registering user': rows['registrant_username'].where(registered, ''),
+        'archived': pd.Series(np.where(archived, 'archived', 'live'), index=rows.index, dtype=object),
+        'archive_date': rows['archive_date'].where(archived, ''),
+        'nih_reporter_link': rows['cedar_study_metadata.metadata_location.nih_reporter_link'],
+        'clinical_trials_study_ID': rows['cedar_study_metadata.metadata_location.clinical_trials_study_ID'],
+        'ov': rows['cedar_study_metadata.metadata_location.clinical_trials_study_link'],
+        'repository_name': repository_name,
+        'repository_study_id': repository_study_id,
+        'repository_study_link': repository_study_link,
+        'repository_metadata': data_repositories.map(repository_metadata),
+        'year_awarded': rows['year_awarded'],
+        'dmp_plan': pd.Series([[] for _ in range(len(rows))], index=rows.index, dtype=object),
+        'manifest_exists': yes_no(truthy(rows['data_linked'])),
+        'data_linked_on_platform': yes_no(study_producing_data & (rows['data_linked'].eq('Yes') | (repository_study_link.map(len) > 0))),
+        'repository_selected': yes_no((repository_name.map(len) > 0) & study_producing_data),
+        'gen3_data_availability': gen3_data_availability,
+        'is_producing_data': yes_no(study_producing_data),
+        'is_producing_data_not_sharing': yes_no(study_producing_data & gen3_data_availability.eq('not_available'))
+    }, index=rows.index).infer_objects()
+
+# Grab necessary metadata from NIH Metadata
+def project_nih(df3):
+    rows = first_row_per_guid(df3)
+    return rows[['appl_id', 'award_type', 'award_amount', 'award_notice_date', 'project_end_date', 'project_title']].infer_objects()
+
+# Data dictionary and common data element counts from the variable-level metadata
+def project_vlmd(df4):
+    rows = first_row_per_guid(df4)
+    vlmd_available = yes_no(truthy(rows['vlmd_available']))
+    available = vlmd_available.eq('Yes')
+
+    def count(column):
+        counted = available & column.notna()
+        num = pd.Series(0, index=rows.index, dtype=np.int64)
+        num[counted] = column[counted].map(len).astype(np.int64)
+        return num
+
+    num_datadicts = count(rows['data_dictionaries'])
+    num_cdes = count(rows['common_data_elements'])
+    heal_cde_used = [list(cdes.keys()) if num > 0 else [] for cdes, num in zip(rows['common_data_elements'], num_cdes)]
+    return pd.DataFrame({
+        'vlmd_available': vlmd_available,
+        'num_data_dictionaries': num_datadicts,
+        'num_common_data_elements': num_cdes,
+        'heal_cde_used': pd.Series(heal_cde_used, index=rows.index, dtype=object)
+    }, index=rows.index).infer_objects()
+
+# Per-study projections, computed as column operations over each whole frame
+def project_studies(df1, df3, df4):
     print(">>> Pull out relevant metadata")
-    def replace_single_quote(input_list):
-        modified_list = [name.replace("'", "`") for name in input_list]
-        return str("[{}]".format(", ".join("'{}'".format(name) for name in modified_list)))
-
-
-    def mydf1function(rowdf):
-        projname = rowdf.iloc[0]['project_title']
-        projnumber = rowdf.iloc[0]['project_number']
-        projPI = rowdf.iloc[0]['investigators_name']
-
-        url = rowdf.iloc[0]['cedar_study_metadata.metadata_location.nih_reporter_link']
-        ctid = rowdf.iloc[0]['cedar_study_metadata.metadata_location.clinical_trials_study_ID']
-        ctlink = rowdf.iloc[0]['cedar_study_metadata.metadata_location.clinical_trials_study_link']
-        data_repositories = rowdf.iloc[0]['cedar_study_metadata.metadata_location.data_repositories']
-        repository_metadata= []
-        for repo in data_repositories:
-            repo_metadata = {}
-            repo_metadata['repository_name'] = repo.get('repository_name')
-            repo_metadata['repository_study_ID'] = repo.get('repository_study_ID', '')  # Default to empty string if key is missing
-            repo_metadata['repository_study_link'] = repo.get('repository_study_link', '')  # Default to empty string if key is missing
-            repository_metadata.append(repo_metadata)
-        
-            print(repository_metadata)
-            
-        repository_name = ''
-        repository_study_id = ''
-        repository_study_link = ''
-        if data_repositories != '':
-            repository_name = data_repositories[0].get('repository_name', '') if data_repositories else ''
-            repository_study_id = data_repositories[0].get('repository_study_ID', '') if data_repositories else ''
-            repository_study_link = data_repositories[0].get('repository_study_link', '') if data_repositories else ''
-        
-        guid_type = rowdf.iloc[0]['guid_type']
-        study_producing_data = guid_type in ['discovery_metadata', 'unregistered_discovery_metadata']
-        if rowdf.iloc[0]['guid_type'] == 'discovery_metadata_archive':
-            archivestatus = 'archived'
-            archivedate = rowdf.iloc[0]['archive_date']
-        else:
-            archivestatus = 'live'
-            # archivedate = 'na'
-            archivedate = ''
-        
-        regstatus_b = rowdf.iloc[0]['is_registered'] and (guid_type == 'discovery_metadata')
-        regstatus = bool_string(regstatus_b)
-        if regstatus_b:
-            regdate = rowdf.iloc[0]['time_of_registration']
-            reguser = rowdf.iloc[0]['registrant_username']
-        else:
-            regdate = ''
-            reguser = ''
-        
-        gen3_data_availability = rowdf.iloc[0]['gen3_data_availability']
-
-        return {
-            ### TODO contact pi name
-            'guid_type': guid_type,
-            'study_name': str(projname).replace("'", "''"),
-            'project_num': projnumber,
-            'investigators_name': replace_single_quote(projPI),
-            'is_registered': regstatus,
-            'time_of_registration': regdate,
-            'Registering user': reguser,
-            'archived': archivestatus,
-            'archive_date': archivedate,
-            'nih_reporter_link': url,
-            'clinical_trials_study_ID': ctid,
-            'ov': ctlink,
-            'repository_name': repository_name,
-            'repository_study_id': repository_study_id,
-            'repository_study_link': repository_study_link,
-            'repository_metadata': repository_metadata,
-            'year_awarded': rowdf.iloc[0]['year_awarded'],
-            'dmp_plan': [],
-            'manifest_exists': bool_string(rowdf.iloc[0]['data_linked']),
-            'data_linked_on_platform': bool_string(study_producing_data and (rowdf.iloc[0]['data_linked'] == 'Yes' or len(repository_study_link) > 0)),
-            'repository_selected': bool_string(len(repository_name) > 0 and study_producing_data),
-            'gen3_data_availability': gen3_data_availability,
-            'is_producing_data': bool_string(study_producing_data),
-            'is_producing_data_not_sharing': bool_string((study_producing_data and gen3_data_availability=='not_available'))
-        }
-
-    # Grab necessary metadata from NIH Metadata
-    def mydf3function(rowdf):
-        appl_id = rowdf.iloc[0]['appl_id']
-        award_type = rowdf.iloc[0]['award_type']
-        award_amount = rowdf.iloc[0]['award_amount']
-        award_notice_date = rowdf.iloc[0]['award_notice_date']
-        project_end_date = rowdf.iloc[0]['project_end_date']
-        project_title = rowdf.iloc[0]['project_title']
-        # project_num = rowdf.iloc[0]['project_num']
-
-        return {
-            'appl_id':appl_id,
-            'award_type':award_type,
-            'award_amount':award_amount,
-            'award_notice_date':award_notice_date,
-            'project_end_date':project_end_date,
-            'project_title':project_title
-        }
-
-    def mydf4function(rowdf):
-        vlmd_available = bool_string(rowdf.iloc[0]['vlmd_available'])
-        num_datadicts = len(rowdf.iloc[0]['data_dictionaries']) if (not pd.isna(rowdf.iloc[0]['data_dictionaries']) and vlmd_available == 'Yes') else 0
-        num_cdes = len(rowdf.iloc[0]['common_data_elements']) if (not pd.isna(rowdf.iloc[0]['common_data_elements']) and vlmd_available == 'Yes') else 0
-        heal_cde_used = list(rowdf.iloc[0]['common_data_elements'].keys()) if num_cdes > 0 else []
-        return {
-            'vlmd_available': vlmd_available,
-            'num_data_dictionaries': num_datadicts,
-            'num_common_data_elements': num_cdes,
-            'heal_cde_used': heal_cde_used
-        }
-
     df1_null = df1.replace(np.nan, '')
-    res_series1 = df1_null.groupby('guids').apply(mydf1function)
-    res_df1 = pd.DataFrame(res_series1.tolist(), index=res_series1.index)
-    res_series3 = df3.groupby('guids').apply(mydf3function)
-    res_df3 = pd.DataFrame(res_series3.tolist(), index=res_series3.index)
-    res_series4 = df4.groupby('guids').apply(mydf4function)
-    res_df4 = pd.DataFrame(res_series4.tolist(), index=res_series4.index)
-
-    ####################################################################################
-    ### CEDAR Completion
-    ####################################################################################
-    print(">>> CEDAR Completion")
-    # create a list to store all the gathered data
-    cedar_comp_info = []
-
-    # these are fields in the Metadata Location section in the MDS that are not on the CEDAR form.
-    # We are excluding them to keep from confusing the PIs if we need to share the list
-    noncedar = [
-        'cedar_study_metadata.metadata_location.data_repositories',
-        'cedar_study_metadata.metadata_location.nih_reporter_link',
-        'cedar_study_metadata.metadata_location.nih_application_id',
-        'cedar_study_metadata.metadata_location.clinical_trials_study_ID',
-        'cedar_study_metadata.metadata_location.cedar_study_level_metadata_template_instance_ID'
-    ]
-
-    #for each row
-    #if the column name begins with cedar_study_metadata.XXX.
-    #loop through the columns with that prefix
-    #count if not empty string/NaN/0
+    res_df1 = project_gen3(df1_null)
+    res_df3 = project_nih(df3)
+    res_df4 = project_vlmd(df4)
+    return res_df1, res_df3, res_df4
+
+####################################################################################
+### CEDAR Completion
+####################################################################################
+# CEDAR form sections whose fields count towards completion, in the order the form lists them
+CEDAR_SECTIONS = ['minimal_info', 'data_availability', 'study_translational_focus', 'study_type',
+                  'human_treatment_applicability', 'human_condition_applicability', 'human_subject_applicability', 'data']
+# Metadata Location only contributes its two website fields (one is autopopulated), always counted as complete
+WEBSITE_FIELDS = 2
+
+# Completed / total / missing field counts per CEDAR section for every study at once
+# A field is completed when it is not '', '0' or NaN; missing fields leave out the NONCEDAR ones
+# Column sets are worked out once for the frame rather than once per row
+def cedar_section_counts(df1):
+    counts = {}
+    for section in CEDAR_SECTIONS + ['metadata_location']:
+        prefix = f'cedar_study_metadata.{section}.'
+        columns = [col for col in df1.columns if isinstance(col, str) and col.startswith(prefix)]
+        values = df1[columns]
+        completed = values.ne('') & values.ne('0') & values.notna()
+        counts[f'{section}_completed'] = completed.sum(axis=1).to_numpy()
+        counts[f'{section}_total'] = np.full(len(df1), len(columns))
+        counts[f'{section}_missing'] = (~completed).loc[:, ~pd.Index(columns).isin(NONCEDAR)].sum(axis=1).to_numpy()
+    return pd.DataFrame(counts, index=df1.index)
+
+# Number of CEDAR fields that count towards completion among flattened column names
+def cedar_total(columns):
+    return sum(len([col for col in columns if col.startswith(f'cedar_study_metadata.{section}.')])
+               for section in CEDAR_SECTIONS) + WEBSITE_FIELDS
+
+# Overall completed CEDAR fields per study, and the number of CEDAR fields the frame has columns for
+def overall_completion(df1):
+    counts = cedar_section_counts(df1)
+    overall_total = sum(counts[f'{section}_total'] for section in CEDAR_SECTIONS) + WEBSITE_FIELDS
+    overall_complete = sum(counts[f'{section}_completed'] for section in CEDAR_SECTIONS) + WEBSITE_FIELDS
+    return overall_complete.to_numpy(dtype=np.int64), overall_total
+
+# As before, every study is stamped with the first study's time_of_last_cedar_updated
+def first_cedar_update(df1):
+    if 'time_of_last_cedar_updated' in df1 and len(df1) > 0:
+        return df1.loc[0, 'time_of_last_cedar_updated']
+    return ''
+
+def completion_stats(guids, overall_complete, overall_total, cedar_update):
     now = datetime.now()
     time_now = now.strftime('%Y-%m-%d %H:%M:%S')
     print(f"* * * time_now: {time_now}")
-    for index, row in df1.iterrows():
-        if 'time_of_last_cedar_updated' in df1:
-            cedar_update = df1.loc[0, 'time_of_last_cedar_updated']
-        else:
-            cedar_update = ''
-
-        hid = row['guids']
-        # if hid == searchhid: print(row)
-        #if the column name begins with cedar_study_metadata.minimal_info.
-        sel_min_info = row.index.str.startswith("cedar_study_metadata.minimal_info.")
-        # how many fields are not completed in Minimal Info section
-
-        not_empty_string = (row.loc[sel_min_info] != "")
-        not_0 = (row.loc[sel_min_info] != "0")
-        not_nan = ~row.loc[sel_min_info].isna()
-        completed_min_info = (not_empty_string & not_0 & not_nan).value_counts().get(True, default=0)
-        # how many total fields in Minimal Info section ***FLAG***
-        total_min_info=len(row.loc[sel_min_info])
-
-        # find the fields that are not completed
-        is_empty_string = (row.loc[sel_min_info] == "")
-        is_0 = (row.loc[sel_min_info] == "0")
-        is_nan = row.loc[sel_min_info].isna()
-        is_noncedar = row.loc[sel_min_info].index.isin(noncedar)
-        missing_min_info = (is_empty_string | is_0 | is_nan) & ~is_noncedar
-        is_missing_min_info = row.loc[sel_min_info].loc[missing_min_info].index.tolist()
-
-        #if the column name is cedar_study_metadata.metadata_location.other_study_websites
-        # if is not nan
-        completed_websites = 2 if row["cedar_study_metadata.metadata_location.other_study_websites"] != np.nan else 1
-
-        # only 2 fields, including autopop field
-        total_websites = 2
-        #if the column name begins with cedar_study_metadata.metadata_location.
-        sel_met_loc = row.index.str.startswith("cedar_study_metadata.metadata_location.")
-        # Find the fields that are not completed
-        is_empty_string = (row.loc[sel_met_loc] == "")
-        is_0 = (row.loc[sel_met_loc] == "0")
-        is_nan = row.loc[sel_met_loc].isna()
-        is_noncedar = row.loc[sel_met_loc].index.isin(noncedar)
-        missing_met_loc = (is_empty_string | is_0 | is_nan) & ~is_noncedar
-        is_missing_met_loc = row.loc[sel_met_loc].loc[missing_met_loc].index.tolist()
-
-        #if the column name begins with cedar_study_metadata.data_availability.
-        data_avail_name = "cedar_study_metadata.data_availability."
-        sel_data_avail = row.index.str.startswith(data_avail_name)
-        sel_data_avail_colnames = [k[len('cedar_study_metadata.'):] for k in row.index[sel_data_avail]]
-        sel_data_avail_values = list(row.loc[sel_data_avail].values)
-        
-        # how many total fields in Data Availability section section
-        total_data_avail=len(sel_data_avail_values)
-        # how many fields are not completed in Data Availability section
-        not_empty_string = (row.loc[sel_data_avail] != "")
-        not_0 = (row.loc[sel_data_avail] != "0")
-        not_nan = ~row.loc[sel_data_avail].isna()
-        completed_data_avail = (not_empty_string & not_0 & not_nan).value_counts().get(True, default=0)
-        # Find the fields that are not completed
-        is_empty_string = (row.loc[sel_data_avail] == "")
-        is_0 = (row.loc[sel_data_avail] == "0")
-        is_nan = row.loc[sel_data_avail].isna()
-        is_noncedar = row.loc[sel_data_avail].index.isin(noncedar)
-        missing_data_avail = (is_empty_string | is_0 | is_nan) & ~is_noncedar
-        is_missing_data_avail = row.loc[sel_data_avail].loc[missing_data_avail].index.tolist()
-
-        #if the column name begins with cedar_study_metadata.study_translational_focus.
-        sel_trans_focus = row.index.str.startswith("cedar_study_metadata.study_translational_focus.")
-        # how many total fields in Study Translational Focus section
-        total_trans_focus=len(row.loc[sel_trans_focus])
-        # how many fields are not completed in Study Translational Focus section
-        not_empty_string = (row.loc[sel_trans_focus] != "")
-        not_0 = (row.loc[sel_trans_focus] != "0")
-        not_nan = ~row.loc[sel_trans_focus].isna()
-        completed_trans_focus = (not_empty_string & not_0 & not_nan).value_counts().get(True, default=0)
-        # Find the fields that are not completed
-        is_empty_string = (row.loc[sel_trans_focus] == "")
-        is_0 = (row.loc[sel_trans_focus] == "0")
-        is_nan = row.loc[sel_trans_focus].isna()
-        is_noncedar = row.loc[sel_trans_focus].index.isin(noncedar)
-        missing_trans_focus = (is_empty_string | is_0 | is_nan) & ~is_noncedar
-        is_missing_trans_focus = row.loc[sel_trans_focus].loc[missing_trans_focus].index.tolist()
-
-        #if the column name begins with cedar_study_metadata.study_type.
-        sel_study_type = row.index.str.startswith("cedar_study_metadata.study_type.")
-        # how many total fields in Study Type section
-        total_study_type=len(row.loc[sel_study_type])
-        # how many fields are not completed in Study Type section
-        not_empty_string = (row.loc[sel_study_type] != "")
-        not_0 = (row.loc[sel_study_type] != "0")
-        not_nan = ~row.loc[sel_study_type].isna()
-        completed_study_type = (not_empty_string & not_0 & not_nan).value_counts().get(True, default=0)
-        # Find the fields that are not completed
-        is_empty_string = (row.loc[sel_study_type] == "")
-        is_0 = (row.loc[sel_study_type] == "0")
-        is_nan = row.loc[sel_study_type].isna()
-        is_noncedar = row.loc[sel_study_type].index.isin(noncedar)
-        missing_study_type = (is_empty_string | is_0 | is_nan) & ~is_noncedar
-        is_missing_study_type = row.loc[sel_study_type].loc[missing_study_type].index.tolist()
-
-        #if the column name begins with cedar_study_metadata.human_treatment_applicability.
-        sel_hum_treat = row.index.str.startswith("cedar_study_metadata.human_treatment_applicability.")
-        # how many total fields in Human Treatment Applicability section
-        total_hum_treat=len(row.loc[sel_hum_treat])
-        # how many fields are not completed in Human Treatment Applicability section
-        not_empty_string = (row.loc[sel_hum_treat] != "")
-        not_0 = (row.loc[sel_hum_treat] != "0")
-        not_nan = ~row.loc[sel_hum_treat].isna()
-        completed_hum_treat = (not_empty_string & not_0 & not_nan).value_counts().get(True, default=0)
-        # Find the fields that are not completed
-        is_empty_string = (row.loc[sel_hum_treat] == "")
-        is_0 = (row.loc[sel_hum_treat] == "0")
-        is_nan = row.loc[sel_hum_treat].isna()
-        is_noncedar = row.loc[sel_hum_treat].index.isin(noncedar)
-        missing_hum_treat = (is_empty_string | is_0 | is_nan) & ~is_noncedar
-        is_missing_hum_treat = row.loc[sel_hum_treat].loc[missing_hum_treat].index.tolist()
-
-        #if the column name begins with cedar_study_metadata.human_condition_applicability.
-        sel_hum_cond = row.index.str.startswith("cedar_study_metadata.human_condition_applicability.")
-        # how many total fields in Human Condition Applicability section
-        total_hum_cond=len(row.loc[sel_hum_cond])
-        # how many fields are not completed in Human Condition Applicability section
-        not_empty_string = (row.loc[sel_hum_cond] != "")
-        not_0 = (row.loc[sel_hum_cond] != "0")
-        not_nan = ~row.loc[sel_hum_cond].isna()
-        completed_hum_cond = (not_empty_string & not_0 & not_nan).value_counts().get(True, default=0)
-        # Find the fields that are not completed
-        is_empty_string = (row.loc[sel_hum_cond] == "")
-        is_0 = (row.loc[sel_hum_cond] == "0")
-        is_nan = row.loc[sel_hum_cond].isna()
-        is_noncedar = row.loc[sel_hum_cond].index.isin(noncedar)
-        missing_hum_cond = (is_empty_string | is_0 | is_nan) & ~is_noncedar
-        is_missing_hum_cond = row.loc[sel_hum_cond].loc[missing_hum_cond].index.tolist()
-
-        #if the column name begins with cedar_study_metadata.human_subject_applicability.
-        sel_hum_subj = row.index.str.startswith("cedar_study_metadata.human_subject_applicability.")
-        # how many total fields in Human Subject Applicability section
-        total_hum_subj=len(row.loc[sel_hum_subj])
-        # how many fields are not completed in Human Subject Applicability section
-        not_empty_string = (row.loc[sel_hum_subj] != "")
-        not_0 = (row.loc[sel_hum_subj] != "0")
-        not_nan = ~row.loc[sel_hum_subj].isna()
-        completed_hum_subj = (not_empty_string & not_0 & not_nan).value_counts().get(True, default=0)
-        # Find the fields that are not completed
-        is_empty_string = (row.loc[sel_hum_subj] == "")
-        is_0 = (row.loc[sel_hum_subj] == "0")
-        is_nan = row.loc[sel_hum_subj].isna()
-        is_noncedar = row.loc[sel_hum_subj].index.isin(noncedar)
-        missing_hum_subj = (is_empty_string | is_0 | is_nan) & ~is_noncedar
-        is_missing_hum_subj = row.loc[sel_hum_subj].loc[missing_hum_subj].index.tolist()
-
-        #if the column name begins with cedar_study_metadata.data.
-        sel_data = row.index.str.startswith("cedar_study_metadata.data.")
-        # how many total fields in Data section
-        total_data=len(row.loc[sel_data])
-        # how many fields are not completed in Data section
-        not_empty_string = (row.loc[sel_data] != "")
-        not_0 = (row.loc[sel_data] != "0")
-        not_nan = ~row.loc[sel_data].isna()
-        completed_data = (not_empty_string & not_0 & not_nan).value_counts().get(True, default=0)
-        # Find the fields that are not completed
-        is_empty_string = (row.loc[sel_data] == "")
-        is_0 = (row.loc[sel_data] == "0")
-        is_nan = row.loc[sel_data].isna()
-        is_noncedar = row.loc[sel_data].index.isin(noncedar)
-        missing_data = (is_empty_string | is_0 | is_nan) & ~is_noncedar
-        is_missing_data = row.loc[sel_data].loc[missing_data].index.tolist()
-        # Collapse original 2 cells into single
-        overall_total = total_min_info + total_websites + total_data_avail + total_trans_focus + total_study_type + total_hum_treat + total_hum_cond + total_hum_subj + total_data
-        overall_complete = completed_min_info + completed_websites + completed_data_avail + completed_trans_focus + completed_study_type + completed_hum_treat + completed_hum_cond + completed_hum_subj + completed_data
-        overall_pct = round((100 * overall_complete / overall_total), 1)
-
-        cedar_comp_info.append(
-            [
-                hid,
-                cedar_update,
-                overall_pct,
-                overall_complete,
-                time_now
-            ])
-
-    col_names = [
-        "guids",
-        "last_cedar_update",
-        'overall_percent_complete',
-        'overall_num_complete',
-        'date_last_mds_update'
-    ]
-    complxn_stats = pd.DataFrame(cedar_comp_info, columns=col_names)
-
-    ####################################################################################
-    ### Combining all dataframes
-    ####################################################################################
+
+    overall_pct = np.round(100 * overall_complete / overall_total, 1)
+    complxn_stats = pd.DataFrame({
+        "guids": guids,
+        "last_cedar_update": [cedar_update] * len(guids),
+        'overall_percent_complete': np.asarray(overall_pct, dtype=np.float64),
+        'overall_num_complete': np.asarray(overall_complete, dtype=np.int64),
+        'date_last_mds_update': [time_now] * len(guids)
+    })
+    return complxn_stats
+
+def cedar_completion(df1):
+    print(">>> CEDAR Completion")
+    overall_complete, overall_total = overall_completion(df1)
+    return completion_stats(df1['guids'].to_numpy(), overall_complete, overall_total, first_cedar_update(df1))
+
+# An incremental parse only sees the changed guids, so the field total and the cedar update are taken from
+# the whole catalog (see sync_state.SyncDelta.catalog) rather than from the subset; a study's completed count
+# only depends on its own fields
+def catalog_completion(complxn_stats, catalog):
+    complxn_stats = complxn_stats.copy()
+    overall_total = cedar_total(catalog['cedar_columns'])
+    complxn_stats['overall_percent_complete'] = np.round(100 * complxn_stats['overall_num_complete'].to_numpy() / overall_total, 1)
+    cedar_update = np.nan if catalog['cedar_update'] is None else catalog['cedar_update']
+    complxn_stats['last_cedar_update'] = [cedar_update] * len(complxn_stats)
+    return complxn_stats
+
+####################################################################################
+### Combining all dataframes
+####################################################################################
+def combine_frames(res_df1, res_df3, res_df4, complxn_stats):
     print(">>> Combining all dataframes")
     merged_df = pd.merge(res_df1, res_df3, how='outer', on='guids')
     merged_df = pd.merge(merged_df, res_df4, how='outer', on='guids')
     merged_df = pd.merge(merged_df, complxn_stats, how='outer', on='guids')
     merged_df = merged_df.rename(columns={'guids': 'hdp_id'})
+    merged_df = merged_df.reindex(columns=OUTPUT_COLUMNS)
     final_df = merged_df.T.transpose()
+    return final_df
 
-    ####################################################################################
-    #### Adding more derived fields
-    ####################################################################################
-
-
-    ####################################################################################
-    ### Prepare data for 
-    ####################################################################################
+####################################################################################
+### Prepare data for 
+####################################################################################
+# Convert to the typed progress_tracker schema (see progress_tracker_schema.py) with real NULLs
+def prepare_output(final_df):
     print(">>> Preparing combined data")
-    tmp_df = final_df
-    tmp_df.fillna(0, inplace=True)
+    logger.debug("%s", final_df['appl_id'])
+    return typed_output(final_df)
+
+# Derived-field overrides (see post_load_rules.py), then the row hashes of the final values
+def apply_rules(insert_df):
+    counts = apply_overrides(insert_df)
+    insert_df[ROW_HASH_COLUMN] = row_hashes(insert_df)
+    return counts
+
+####################################################################################
+### Sharded parsing
+####################################################################################
+# Records the shard processes read; they inherit it through fork rather than having it pickled to them
+_shard_records = []
+
+# Flatten, clean and project one contiguous slice of the records
+# Anything that depends on the whole catalog (the CEDAR field totals, the first study's cedar update,
+# the rows the positional appl_id concat adds, dtypes after the outer merges) is left to merge_shards
+def parse_shard(records, manifests=True):
+    flattener = StudyMetadataFlattener()
+    metadata, vlmd_guids, study_cnt = gather_metadata(records, flattener, manifests)
+    df1 = ensure_columns(transform_data(metadata['gen3_metadata']), GEN3_COLUMNS)
+    df3 = ensure_columns(transform_data(metadata['nih_metadata']), NIH_COLUMNS)
+    df4 = ensure_columns(transform_data(metadata['vlmd_metadata']), VLMD_COLUMNS)
+    frames = project_studies(df1, df3, df4)
+    overall_complete, _ = overall_completion(df1)
+    return {
+        'frames': frames,
+        'guids': df1['guids'].to_numpy(),
+        'overall_complete': overall_complete,
+        'cedar_columns': [col for col in df1.columns if isinstance(col, str) and col.startswith('cedar_study_metadata.')],
+        'has_cedar_update': 'time_of_last_cedar_updated' in df1,
+        'cedar_update': first_cedar_update(df1),
+        'gen3_rows': len(df1),
+        'nih_rows': len(df3),
+        'all_guids': set().union(*metadata.values()),
+        'vlmd_guids': vlmd_guids,
+        'study_cnt': study_cnt,
+        'flattener': flattener
+    }
+
+def _run_shard(start, end, sender, manifests):
+    try:
+        sender.send(('ok', parse_shard(_shard_records[start:end], manifests)))
+    except Exception:
+        sender.send(('error', traceback.format_exc()))
+    finally:
+        sender.close()
+
+# Parse `workers` contiguous slices of the records in forked processes, results in slice order
+# Plain Process + Pipe rather than a Pool: Lambda has no /dev/shm, which the Pool's queues need
+def run_shards(records, workers, manifests=True):
+    global _shard_records
+    context = multiprocessing.get_context('fork')
+    bounds = np.linspace(0, len(records), workers + 1).astype(int)
+    _shard_records = records
+    sys.stdout.flush()
+    processes = []
+    try:
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_run_shard, args=(start, end, sender, manifests), daemon=True)
+            process.start()
+            sender.close()
+            processes.append((process, receiver))
+        parts = []
+        for shard, (process, receiver) in enumerate(processes):
+            status, result = receiver.recv()
+            process.join()
+            if status != 'ok':
+                raise RuntimeError(f"Parse shard {shard} failed:\n{result}")
+            parts.append(result)
+        return parts
+    finally:
+        _shard_records = []
+        for process, receiver in processes:
+            receiver.close()
+            if process.is_alive():
+                process.terminate()
+
+# Concatenate one projection across shards back into guid order
+def concat_shards(frames):
+    frames = [df for df in frames if len(df)] or frames[:1]
+    return pd.concat(frames).sort_index(kind='stable')
+
+# Rebuild what the serial path computes over the whole catalog from the shard results
+def merge_shards(parts):
+    res_df1, res_df3, res_df4 = (concat_shards([part['frames'][i] for part in parts]) for i in range(3))
+
+    # transform_metadata concats df3's appl_id onto df1 by position, so when there are more NIH than gen3
+    # records df1 gets that many guid-less rows: one blank '' study in res_df1 and NaN guids in the stats
+    extra_rows = max(sum(part['nih_rows'] for part in parts) - sum(part['gen3_rows'] for part in parts), 0)
+    if extra_rows:
+        blank = pd.DataFrame({col: [''] for col in ['guids'] + GEN3_COLUMNS})
+        res_df1 = concat_shards([res_df1, project_gen3(blank)])
+
+    overall_total = cedar_total(set().union(*(part['cedar_columns'] for part in parts)))
+    guids = np.concatenate([part['guids'] for part in parts] + [np.full(extra_rows, np.nan, dtype=object)])
+    overall_complete = np.concatenate([part['overall_complete'] for part in parts] +
+                                      [np.full(extra_rows, WEBSITE_FIELDS, dtype=np.int64)])
+
+    cedar_update = ''
+    if any(part['has_cedar_update'] for part in parts):
+        first = next(part for part in parts if part['gen3_rows'])
+        cedar_update = first['cedar_update'] if first['has_cedar_update'] else np.nan
+    complxn_stats = completion_stats(guids, overall_complete, overall_total, cedar_update)
+    return res_df1, res_df3, res_df4, complxn_stats
+
+def parse_serial(response_json, flattener, metrics, manifests=True):
+    with metrics.span('flatten') as span:
+        metadata, vlmd_guids, study_cnt = gather_metadata(response_json, flattener, manifests)
+        span.rows = len(metadata['gen3_metadata'])
+    metrics.count('guids', len(set().union(*metadata.values())))
+    if not any(metadata.values()):
+        return None
+
+    with metrics.span('transform_data') as span:
+        df1, df2, df3, df4 = transform_metadata(metadata)
+        span.set_frames(df1, df2, df3, df4)
+    with metrics.span('project_studies') as span:
+        res_df1, res_df3, res_df4 = project_studies(df1, df3, df4)
+        span.set_frames(res_df1, res_df3, res_df4)
+    with metrics.span('cedar_completion') as span:
+        complxn_stats = cedar_completion(df1)
+        span.set_frames(complxn_stats)
+    return (res_df1, res_df3, res_df4, complxn_stats), vlmd_guids, study_cnt
+
+def parse_sharded(response_json, workers, flattener, metrics, manifests=True):
+    records = list(response_json.items() if isinstance(response_json, dict) else response_json)
+    with metrics.span('parse_shards') as span:
+        parts = run_shards(records, workers, manifests)
+        span.rows = len(records)
+    del records
+    metrics.count('shards', len(parts))
+    for part in parts:
+        flattener.update(part['flattener'])
+    metrics.count('guids', len(set().union(*(part['all_guids'] for part in parts))))
+    if not any(part['all_guids'] for part in parts):
+        return None
+
+    vlmd_guids = {guid: entry for part in parts for guid, entry in part['vlmd_guids'].items()}
+    study_cnt = [entry for part in parts for entry in part['study_cnt']]
+    with metrics.span('merge_shards') as span:
+        frames = merge_shards(parts)
+        span.set_frames(*frames)
+    return frames, vlmd_guids, study_cnt
 
-    print(str(tmp_df['appl_id']))
-    # tmp_df['appl_id'] = tmp_df['appl_id'].astype(float).astype(int).astype(str)
-    tmp_df['appl_id'] = tmp_df['appl_id'].astype(str)
+## Function to parse the gen3_discovert
+# Each stage above is a separate function so it can be timed on its own (see bench_parse.py)
+# With `workers` > 1 the records are split into that many contiguous shards that are flattened, cleaned
+# and projected in parallel processes; the output is identical to the serial parse
+# `catalog` (see sync_state.SyncDelta.catalog) gives the completion of a partial parse the whole catalog's field total
+def parse_mds_response(response_json, write_to_disk=False, metrics=None, workers=1, catalog=None):
+    metrics = metrics or SyncMetrics()
+
+    if workers > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        logger.warning("Sharded parsing needs fork; parsing serially")
+        workers = 1
+    flattener = StudyMetadataFlattener()
+    # The manifests only go into the local studies_for_cnt.xlsx
+    if workers > 1:
+        parsed = parse_sharded(response_json, workers, flattener, metrics, manifests=write_to_disk)
+    else:
+        parsed = parse_serial(response_json, flattener, metrics, manifests=write_to_disk)
+    drift = flattener.report()
+    if drift:
+        logger.warning("study_metadata schema drift: %s", json.dumps(drift))
+        metrics.count('schema_drift', drift)
+
+    if parsed is None:
+        # An incremental sync that only removed guids still writes through diff_write, which needs the columns
+        print("**** No records to parse")
+        insert_df = typed_output(pd.DataFrame(columns=OUTPUT_COLUMNS))
+        insert_df[ROW_HASH_COLUMN] = row_hashes(insert_df)
+        return insert_df
+    (res_df1, res_df3, res_df4, complxn_stats), vlmd_guids, study_cnt = parsed
+    if catalog is not None:
+        complxn_stats = catalog_completion(complxn_stats, catalog)
 
-    insert_df = tmp_df.astype(str)
+    if write_to_disk:
+        ## Print studies that have variable level metadata
+        with open('/tmp/vlmd_dump.json', 'w') as f:
+            jsonf = json.dumps(vlmd_guids, indent=4)
+            # write json object to file
+            f.write(jsonf)
+        pd.DataFrame.from_records(study_cnt, index='guid').to_excel('/tmp/studies_for_cnt.xlsx')
+
+    with metrics.span('merge') as span:
+        final_df = combine_frames(res_df1, res_df3, res_df4, complxn_stats)
+        span.set_frames(final_df)
+    with metrics.span('typed_output') as span:
+        insert_df = prepare_output(final_df)
+        span.set_frames(insert_df)
+    with metrics.span('overrides'):
+        metrics.count('overrides', apply_rules(insert_df))
+    metrics.count('rows', len(insert_df))
 
     if write_to_disk:
         insert_df.to_csv('/tmp/output.csv')
     return insert_df
 
-def mds_data_prep(local=False):
-    ####################################################################################
-    ### Find MDS record for the study searching by project number, appl_id, or hdpid
-    ####################################################################################
-    print(">>> Find MDS record for the study searching by project number, appl_id, or hdpid")
-    query = 'https://healdata.org/mds/metadata?data=True&limit=1000000'
-    print(f'Query: {query}')
-
-    response = requests.get(f"{query}")
-    response_json = response.json()
-    mds_data = parse_mds_response(response_json, write_to_disk=local)
+# `delta` (see sync_state.SyncDelta) limits parsing to the guids that were added or changed since the last sync
+# `snapshot` (or MDS_SNAPSHOT) replays a cached raw MDS response instead of calling the MDS (see mds_source.py)
+# `metrics` (see sync_metrics.SyncMetrics) collects a timed span for the fetch and every parse stage
+def mds_data_prep(local=False, delta=None, snapshot=None, metrics=None):
+    metrics = metrics or SyncMetrics()
+    response_json = load_mds_records(snapshot=snapshot, metrics=metrics)
+    if delta is None or delta.full:
+        return prepare_records(response_json, local=local, metrics=metrics)
+    # The changed records are read ahead so the catalog the incremental parse needs is complete
+    records = list(delta.filter_records(response_json))
+    return prepare_records(records, local=local, metrics=metrics, catalog=delta.catalog)
+
+# Parse records that were already fetched (and filtered)
+def prepare_records(response_json, local=False, metrics=None, catalog=None):
+    # MDS_PARSE_WORKERS > 1 parses in that many processes (0 = one per CPU); 1 keeps the serial parse
+    workers = int(os.getenv('MDS_PARSE_WORKERS', 1)) or os.cpu_count() or 1
+    mds_data = parse_mds_response(response_json, write_to_disk=local, metrics=metrics, workers=workers, catalog=catalog)
     return mds_data
@@ -0,0 +1,186 @@
+import re
+import codecs
+import json
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+MDS_URL = 'https://healdata.org/mds/metadata'
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_TIMEOUT = 120
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+
+# Create a keep-alive session that is shared by all page workers
+# The connection pool is sized to the worker count so no worker has to open its own connection
+def make_session(max_workers=DEFAULT_MAX_WORKERS):
+    retry = Retry(total=3, backoff_factor=1, status_forcelist=(500, 502, 503, 504), allowed_methods=('GET',))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_workers, 1), max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# Pull a single offset/limit page of the MDS as a guid -> record mapping
+def fetch_mds_page(session, url, offset, limit, timeout=DEFAULT_TIMEOUT):
+    response = session.get(url, params={'data': 'True', 'limit': limit, 'offset': offset}, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+# Page through the MDS with offset/limit, keeping up to `max_workers` pages in flight at once
+# A page shorter than `page_size` marks the end of the catalog; pages are merged in offset order
+# so the result matches the single `limit=1000000` pull that parse_mds_response has always taken.
+# A `page_size` of 0 (or less) falls back to that single pull.
+def fetch_mds(url=MDS_URL, page_size=DEFAULT_PAGE_SIZE, max_workers=DEFAULT_MAX_WORKERS, session=None, timeout=DEFAULT_TIMEOUT):
+    own_session = session is None
+    if own_session:
+        session = make_session(max_workers)
+
+    try:
+        if page_size <= 0:
+            return fetch_mds_page(session, url, 0, 1000000, timeout)
+
+        pages = {}
+        in_flight = {}
+        next_offset = 0
+        end_offset = None
+        with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as pool:
+            while True:
+                while end_offset is None and len(in_flight) < max(max_workers, 1):
+                    future = pool.submit(fetch_mds_page, session, url, next_offset, page_size, timeout)
+                    in_flight[future] = next_offset
+                    next_offset += page_size
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    offset = in_flight.pop(future)
+                    page = future.result()
+                    pages[offset] = page
+                    if len(page) < page_size:
+                        end_offset = offset if end_offset is None else min(end_offset, offset)
+
+        # Records that shift between pages while the catalog is being edited can show up twice;
+        # merging into a dict keeps the last copy of each guid
+        response_json = {}
+        for offset in sorted(pages):
+            response_json.update(pages[offset])
+        print(f"**** Pulled {len(response_json)} guids in {len(pages)} pages of {page_size}")
+        return response_json
+    finally:
+        if own_session:
+            session.close()
+
+# A character that can follow a number or literal (true / false / null) in JSON
+_SCALAR_END = re.compile(r'[,}\]\s]')
+
+# Incrementally decode a top-level JSON object from an iterable of byte chunks, yielding one
+# (key, value) pair at a time. Only the current value and the unread tail of the last chunk are
+# kept in memory, so a multi-hundred-MB MDS response never has to be materialized as a whole.
+def iter_json_object(chunks):
+    text = codecs.iterdecode(chunks, 'utf-8')
+    buf = ''
+    pos = 0
+
+    # Append chunks until at least `min_size` new characters are buffered; False once input is exhausted
+    def read_more(min_size=1):
+        nonlocal buf, pos
+        parts = [buf[pos:]]
+        read = 0
+        for chunk in text:
+            parts.append(chunk)
+            read += len(chunk)
+            if read >= min_size:
+                break
+        buf = ''.join(parts)
+        pos = 0
+        return read > 0
+
+    # Skip whitespace and return the next significant character ('' at end of input)
+    def peek():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\n\r':
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not read_more():
+                return ''
+
+    def decode_value():
+        nonlocal pos
+        # A number or literal has no closing character of its own, and raw_decode takes whatever prefix of it is
+        # buffered ('1.' for 1.25); it is decoded only once what follows it is buffered too, or the input ended
+        if buf[pos] not in '{["':
+            while not _SCALAR_END.search(buf, pos) and read_more():
+                pass
+        while True:
+            try:
+                value, end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Value is cut off at the end of the buffer; double what is buffered and try again
+                if not read_more(len(buf) - pos):
+                    raise
+                continue
+            pos = end
+            return value
+
+    def expect(char):
+        nonlocal pos
+        found = peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' at offset {pos} of MDS response, found '{found}'")
+        pos += 1
+
+    expect('{')
+    if peek() == '}':
+        return
+    while True:
+        peek()
+        key = decode_value()
+        expect(':')
+        peek()
+        yield key, decode_value()
+        if peek() == ',':
+            pos += 1
+            continue
+        expect('}')
+        return
+
+# Stream the MDS as (guid, record) pairs, one offset/limit page at a time over a single keep-alive session
+# Pages are read sequentially because each record is handed to the parser as soon as it is decoded;
+# a `page_size` of 0 (or less) streams the single `limit=1000000` response instead
+def iter_mds(url=MDS_URL, page_size=DEFAULT_PAGE_SIZE, session=None, timeout=DEFAULT_TIMEOUT, chunk_size=DEFAULT_CHUNK_SIZE):
+    own_session = session is None
+    if own_session:
+        session = make_session(1)
+
+    try:
+        limit = page_size if page_size > 0 else 1000000
+        offset = 0
+        pages = 0
+        seen = set()
+        while True:
+            count = 0
+            with session.get(url, params={'data': 'True', 'limit': limit, 'offset': offset}, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                for guid, record in iter_json_object(response.iter_content(chunk_size)):
+                    count += 1
+                    # Records that shift between pages while the catalog is being edited are only parsed once
+                    if guid in seen:
+                        continue
+                    seen.add(guid)
+                    yield guid, record
+            pages += 1
+            if page_size <= 0 or count < page_size:
+                break
+            offset += page_size
+        print(f"**** Streamed {len(seen)} guids in {pages} pages of {limit}")
+    finally:
+        if own_session:
+            session.close()
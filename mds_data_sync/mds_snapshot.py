@@ -0,0 +1,126 @@
+import os
+import sys
+import gzip
+import json
+import hashlib
+import tempfile
+from datetime import datetime, timezone
+from mds_fetch import make_session, iter_json_object, MDS_URL, DEFAULT_TIMEOUT, DEFAULT_CHUNK_SIZE
+
+DEFAULT_SNAPSHOT_DIR = '/tmp/mds_snapshots'
+
+# Snapshot cache layout:
+#   <cache_dir>/objects/<sha256>.json.gz - gzip of a raw MDS response, named by the sha256 of the raw bytes,
+#                                           so identical pulls are only stored once
+#   <cache_dir>/snapshots.jsonl           - one line per pull: timestamp, url, sha256, ETag and Last-Modified
+def object_path(cache_dir, sha256):
+    return os.path.join(cache_dir, 'objects', f'{sha256}.json.gz')
+
+def list_snapshots(cache_dir=DEFAULT_SNAPSHOT_DIR):
+    index_path = os.path.join(cache_dir, 'snapshots.jsonl')
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _append_index(cache_dir, entry):
+    with open(os.path.join(cache_dir, 'snapshots.jsonl'), 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+# Pull the full MDS into the snapshot cache and return its index entry
+# The last ETag / Last-Modified seen for `url` is sent back, and a 304 reuses the stored object;
+# otherwise the response is streamed to disk (hashing and compressing on the way) rather than held in memory
+def fetch_snapshot(url=MDS_URL, cache_dir=DEFAULT_SNAPSHOT_DIR, session=None, timeout=DEFAULT_TIMEOUT):
+    os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+    previous = [entry for entry in list_snapshots(cache_dir) if entry['url'] == url]
+    previous = previous[-1] if previous else None
+
+    headers = {}
+    if previous and os.path.exists(object_path(cache_dir, previous['sha256'])):
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            headers['If-Modified-Since'] = previous['last_modified']
+
+    own_session = session is None
+    if own_session:
+        session = make_session(1)
+    try:
+        with session.get(url, params={'data': 'True', 'limit': 1000000}, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 304:
+                print(f"**** MDS not modified since snapshot {previous['sha256'][:12]}")
+                entry = dict(previous, timestamp=datetime.now(timezone.utc).isoformat(), not_modified=True)
+                _append_index(cache_dir, entry)
+                return entry
+
+            response.raise_for_status()
+            digest = hashlib.sha256()
+            size = 0
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.join(cache_dir, 'objects'), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+                    for chunk in response.iter_content(DEFAULT_CHUNK_SIZE):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        gz.write(chunk)
+                sha256 = digest.hexdigest()
+                if os.path.exists(object_path(cache_dir, sha256)):
+                    os.remove(tmp_path)
+                else:
+                    os.replace(tmp_path, object_path(cache_dir, sha256))
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            entry = {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'url': url,
+                'sha256': sha256,
+                'size': size,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }
+            _append_index(cache_dir, entry)
+            print(f"**** Stored MDS snapshot {sha256[:12]} ({size} bytes)")
+            return entry
+    finally:
+        if own_session:
+            session.close()
+
+# Resolve a snapshot reference to a file: 'latest', a (prefix of a) sha256 or timestamp from the index, or a path
+def resolve_snapshot(ref, cache_dir=DEFAULT_SNAPSHOT_DIR):
+    if os.path.isfile(ref):
+        return ref
+    entries = list_snapshots(cache_dir)
+    if ref == 'latest':
+        matches = entries[-1:]
+    else:
+        matches = [entry for entry in entries if entry['sha256'].startswith(ref) or entry['timestamp'].startswith(ref)]
+    if not matches:
+        raise FileNotFoundError(f"No MDS snapshot matching '{ref}' in {cache_dir}")
+    return object_path(cache_dir, matches[-1]['sha256'])
+
+# Load a snapshot for replay without any network access
+# With `stream` the snapshot is decoded one guid at a time, like mds_fetch.iter_mds
+def load_snapshot(ref='latest', cache_dir=DEFAULT_SNAPSHOT_DIR, stream=False):
+    path = resolve_snapshot(ref, cache_dir)
+    print(f"**** Replaying MDS snapshot {path}")
+    opener = gzip.open if path.endswith('.gz') else open
+    if not stream:
+        with opener(path, 'rb') as f:
+            return json.load(f)
+
+    def records():
+        with opener(path, 'rb') as f:
+            yield from iter_json_object(iter(lambda: f.read(DEFAULT_CHUNK_SIZE), b''))
+    return records()
+
+# Usage: python mds_snapshot.py [fetch|list]
+if __name__ == '__main__':
+    cache_dir = os.getenv('MDS_SNAPSHOT_DIR', DEFAULT_SNAPSHOT_DIR)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    if command == 'fetch':
+        fetch_snapshot(os.getenv('MDS_URL', MDS_URL), cache_dir)
+    for entry in list_snapshots(cache_dir):
+        print(f"{entry['timestamp']}  {entry['sha256'][:12]}  {entry.get('size', '')}  {entry['url']}")
@@ -0,0 +1,42 @@
+import os
+from mds_fetch import fetch_mds, iter_mds, MDS_URL, DEFAULT_PAGE_SIZE, DEFAULT_MAX_WORKERS
+from mds_snapshot import fetch_snapshot, load_snapshot, DEFAULT_SNAPSHOT_DIR
+from sync_metrics import SyncMetrics
+
+# Raw MDS records for a sync, from the live MDS or the snapshot cache as configured
+# Kept apart from mds_data_prep so the lambda can fetch and diff the catalog without importing pandas
+
+# `snapshot` (or MDS_SNAPSHOT) replays a cached raw MDS response instead of calling the MDS (see mds_snapshot.py)
+# Returns a dict of guid -> record, or an iterator of (guid, record) pairs when streamed
+def load_mds_records(snapshot=None, metrics=None):
+    ####################################################################################
+    ### Find MDS record for the study searching by project number, appl_id, or hdpid
+    ####################################################################################
+    metrics = metrics or SyncMetrics()
+    print(">>> Find MDS record for the study searching by project number, appl_id, or hdpid")
+    # MDS_PAGE_SIZE=0 restores the old single `limit=1000000` request
+    query = os.getenv('MDS_URL', MDS_URL)
+    page_size = int(os.getenv('MDS_PAGE_SIZE', DEFAULT_PAGE_SIZE))
+    max_workers = int(os.getenv('MDS_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    # MDS_STREAM=true decodes the response one guid at a time instead of building the whole document first
+    stream = os.getenv('MDS_STREAM', 'false').lower() in ('1', 'true', 'yes')
+    print(f'Query: {query} (page size {page_size}, {"streamed" if stream else f"{max_workers} workers"})')
+
+    # MDS_SNAPSHOT_DIR keeps a compressed copy of every pull there, fetched with ETag / If-Modified-Since
+    snapshot_dir = os.getenv('MDS_SNAPSHOT_DIR', '')
+    snapshot = snapshot or os.getenv('MDS_SNAPSHOT', '')
+
+    # A streamed fetch is consumed during 'flatten', so its time shows up there
+    with metrics.span('fetch') as span:
+        if snapshot:
+            response_json = load_snapshot(snapshot, snapshot_dir or DEFAULT_SNAPSHOT_DIR, stream=stream)
+        elif snapshot_dir:
+            entry = fetch_snapshot(query, snapshot_dir)
+            response_json = load_snapshot(entry['sha256'], snapshot_dir, stream=stream)
+        elif stream:
+            response_json = iter_mds(query, page_size=page_size)
+        else:
+            response_json = fetch_mds(query, page_size=page_size, max_workers=max_workers)
+        if isinstance(response_json, dict):
+            span.rows = len(response_json)
+    return response_json
@@ -0,0 +1,79 @@
+import json
+import sys
+import hashlib
+from email.utils import formatdate
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for the MDS `/mds/metadata` endpoint so the fetch engine can be run without network access
+# Serves a guid -> record mapping with the same `data`, `limit` and `offset` semantics as the real MDS,
+# plus ETag / If-None-Match so conditional fetches can be tried out
+#
+# Usage: python mds_stub_server.py <mds_dump.json> [port]
+# then point the sync at it with MDS_URL=http://localhost:<port>/mds/metadata
+class MDSStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path.rstrip('/') != '/mds/metadata':
+            self.send_error(404)
+            return
+
+        params = parse_qs(parsed.query)
+        limit = int(params.get('limit', ['10'])[0])
+        offset = int(params.get('offset', ['0'])[0])
+        with_data = params.get('data', ['False'])[0].lower() == 'true'
+
+        guids = self.server.guids[offset:offset + limit]
+        if with_data:
+            page = {guid: self.server.records[guid] for guid in guids}
+        else:
+            page = guids
+        self.server.requests_served += 1
+
+        body = json.dumps(page).encode('utf-8')
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', self.server.last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# Start the stand-in server on a background thread; port 0 picks a free port
+# Returns the server (call `shutdown()` when finished) and the metadata URL to fetch from
+def serve_mds(records, host='127.0.0.1', port=0):
+    server = ThreadingHTTPServer((host, port), MDSStubHandler)
+    server.daemon_threads = True
+    server.records = records
+    server.guids = list(records.keys())
+    server.requests_served = 0
+    server.last_modified = formatdate(usegmt=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://{host}:{server.server_address[1]}/mds/metadata'
+    return server, url
+
+if __name__ == '__main__':
+    with open(sys.argv[1]) as f:
+        records = json.load(f)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    server, url = serve_mds(records, host='0.0.0.0', port=port)
+    print(f'Serving {len(records)} guids at {url.replace("0.0.0.0", "localhost")}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,123 @@
+import sys
+import json
+import random
+from study_metadata_schema import STUDY_METADATA_FIELDS
+
+# Approximate number of guids in the HEAL MDS today; benchmark scales are multiples of this
+BASE_GUID_COUNT = 1500
+
+# study_metadata sections and keys, taken from the field registry so synthetic catalogs show no schema drift
+STUDY_METADATA_SECTIONS = {section: keys for section, keys in STUDY_METADATA_FIELDS.items() if keys}
+
+GUID_TYPES = ['discovery_metadata'] * 7 + ['unregistered_discovery_metadata'] * 2 + ['discovery_metadata_archive']
+REPOSITORIES = ['ICPSR', 'Vivli', 'Dryad', 'NIDA Data Share', 'Mendeley Data', 'JCOIN Data Repository']
+WORDS = ['opioid', 'pain', 'chronic', "patient's", 'treatment', 'outcome', 'cohort', 'trial', 'community', 'recovery']
+
+# A CEDAR form value: unanswered ('' / [] / a dict of blanks), a list of choices, a flag or free text
+def _cedar_value(rng, key):
+    roll = rng.random()
+    if roll < 0.25:
+        return ''
+    if roll < 0.35:
+        return []
+    if roll < 0.38:
+        return {'value': '', 'label': None}
+    if roll < 0.6:
+        return rng.sample(WORDS, rng.randint(1, 3))
+    if roll < 0.63:
+        return 0
+    if roll < 0.68:
+        return rng.random() < 0.5
+    return f"{key.replace('_', ' ')}: {' '.join(rng.sample(WORDS, 4))}"
+
+def _study_metadata(rng, i):
+    study_metadata = {section: {key: _cedar_value(rng, key) for key in keys} for section, keys in STUDY_METADATA_SECTIONS.items()}
+    location = study_metadata['metadata_location']
+    location['nih_reporter_link'] = f'https://reporter.nih.gov/project-details/{10000000 + i}'
+    location['nih_application_id'] = str(10000000 + i)
+    location['data_repositories'] = []
+    for _ in range(rng.choice([0, 0, 1, 1, 2])):
+        location['data_repositories'].append({
+            'repository_name': rng.choice(REPOSITORIES),
+            'repository_study_ID': rng.choice(['', f'{rng.randint(1000, 99999)}']),
+            'repository_study_link': rng.choice(['', f'https://doi.org/10.3886/ICPSR{rng.randint(1000, 99999)}']),
+            'repository_persistent_ID': '',
+        })
+    return study_metadata
+
+def synthetic_record(rng, i):
+    guid = f'HDP{i:05d}'
+    guid_type = rng.choice(GUID_TYPES)
+    appl_id = 10000000 + i
+    project_num = f'{rng.choice([1, 3, 5])}{rng.choice(["R01", "U24", "UG3", "R61"])}{rng.choice(["DA", "NS", "AT"])}{i:06d}-0{rng.randint(1, 5)}'
+    title = f"{' '.join(rng.sample(WORDS, 5)).capitalize()} study {i}"
+
+    gen3_discovery = {
+        '_hdp_uid': guid,
+        'appl_id': str(appl_id),
+        'project_title': title,
+        'project_number': project_num,
+        'investigators_name': [f'PI {i}', rng.choice(["O'Connor", 'Smith', "D'Angelo"])],
+        'institutions': rng.choice(['University A', 'University B']),
+        'is_registered': rng.random() < 0.7,
+        'time_of_registration': f'2023-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        'registrant_username': f'user{i}@example.org',
+        'archive_date': '2024-02-01' if guid_type == 'discovery_metadata_archive' else '',
+        'year_awarded': str(2019 + i % 6),
+        'tags': [{'name': rng.choice(['HEAL', 'JCOIN', 'BACPAC']), 'category': 'Research Program'}],
+        '__manifest': [{'file_name': f'file{k}.csv', 'file_size': rng.randint(1, 10 ** 7), 'md5sum': '0' * 32}
+                       for k in range(rng.choice([0, 0, 0, 1, 3]))],
+        'study_metadata': _study_metadata(rng, i),
+    }
+    if rng.random() < 0.8:
+        gen3_discovery['data_availability'] = rng.choice(['available', 'not_available', 'pending'])
+    if rng.random() < 0.6:
+        gen3_discovery['time_of_last_cedar_updated'] = f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00'
+
+    record = {
+        '_guid_type': guid_type,
+        'gen3_discovery': gen3_discovery,
+        'nih_reporter': {
+            'appl_id': appl_id,
+            'project_num': project_num,
+            'project_title': title,
+            'award_type': str(rng.choice([1, 3, 5])),
+            'award_amount': rng.randint(100000, 5000000),
+            'award_notice_date': f'20{rng.randint(19, 24)}-09-{rng.randint(1, 28):02d}T00:00:00',
+            'project_start_date': '2019-09-30T00:00:00',
+            'project_end_date': f'20{rng.randint(24, 29)}-08-31T00:00:00',
+            'org_name': rng.choice(['UNIVERSITY A', 'UNIVERSITY B']),
+            'agency_ic_admin': {'code': 'DA', 'abbreviation': 'NIDA'},
+            'principal_investigators': [{'full_name': f'PI {i}', 'profile_id': i}],
+        },
+    }
+    if rng.random() < 0.3:
+        record['clinicaltrials_gov'] = {
+            'NCTId': f'NCT{i:08d}',
+            'BriefTitle': title,
+            'OverallStatus': rng.choice(['RECRUITING', 'COMPLETED']),
+            'Condition': rng.sample(WORDS, 2),
+            'EnrollmentCount': rng.randint(10, 5000),
+        }
+    if rng.random() < 0.35:
+        record['variable_level_metadata'] = {
+            'data_dictionaries': {f'dd_{k}.json': f'{guid}-dd-{k}' for k in range(rng.choice([0, 1, 2, 4]))},
+            'common_data_elements': {f'HEAL CDE {k}': f'cde-{k}' for k in range(rng.choice([0, 1, 3]))},
+        }
+    return guid, record
+
+# Generate a synthetic guid -> record mapping shaped like the MDS `/mds/metadata?data=True` response
+# The same count and seed always give the same catalog
+def generate_mds(count=BASE_GUID_COUNT, seed=0):
+    rng = random.Random(seed)
+    records = dict(synthetic_record(rng, i) for i in range(count))
+    # The parser expects at least one study to list common data elements
+    records['HDP00000'].setdefault('variable_level_metadata', {'data_dictionaries': {}, 'common_data_elements': {}})
+    records['HDP00000']['variable_level_metadata']['common_data_elements'] = {'HEAL CDE 0': 'cde-0'}
+    return records
+
+# Usage: python mds_synthetic.py <count> <out.json> (serve it with mds_stub_server.py)
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else BASE_GUID_COUNT
+    with open(sys.argv[2] if len(sys.argv) > 2 else 'mds_synthetic.json', 'w') as f:
+        json.dump(generate_mds(count), f)
@@ -0,0 +1,85 @@
+import os
+import logging
+import mysql.connector
+from mysql.connector import pooling
+
+logger = logging.getLogger(__name__)
+
+# One pool per Lambda container: created on first use and kept across warm invocations
+_pool = None
+_pool_config = None
+
+def connection_config(**options):
+    return dict(host=os.getenv('DB_HOST'),
+                database=os.getenv('DB_NAME'),
+                user=os.getenv('DB_USER'),
+                password=os.getenv('DB_PASSWORD'),
+                **options)
+
+# The module's pool, (re)created when the connection settings change; returns (pool, created)
+def get_pool(**options):
+    global _pool, _pool_config
+    config = connection_config(**options)
+    if _pool is not None and config == _pool_config:
+        return _pool, False
+    reset_pool()
+    _pool = pooling.MySQLConnectionPool(pool_name='mds_data_sync',
+                                        pool_size=int(os.getenv('DB_POOL_SIZE', 1)),
+                                        pool_reset_session=True,
+                                        **config)
+    _pool_config = config
+    logger.info("Created MySQL connection pool for %s/%s", config['host'], config['database'])
+    return _pool, True
+
+# A healthy pooled connection; close() hands it back to the pool instead of disconnecting
+# The ping reconnects a connection the server dropped while the container was frozen between invocations
+def get_connection(**options):
+    pool, created = get_pool(**options)
+    try:
+        connection = pool.get_connection()
+    except pooling.PoolError:
+        # Every connection is checked out (one was not returned); start over with a fresh pool
+        logger.warning("MySQL connection pool exhausted; recreating it")
+        reset_pool()
+        pool, created = get_pool(**options)
+        connection = pool.get_connection()
+    connection.ping(reconnect=True, attempts=3, delay=1)
+    return connection, created
+
+# The data version the sync last stamped on `table_name` (see progress_tracker_loader.stamp_data_version);
+# None before the first one
+def read_data_version(table_name, **options):
+    connection, _ = get_connection(**options)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT data_version FROM `{table_name}__version` WHERE id = 1;")
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except mysql.connector.ProgrammingError:
+        # No `<table>__version` table yet
+        return None
+    finally:
+        cursor.close()
+        connection.close()
+
+# Disconnects the pool's idle connections before dropping it, so they are not left open until the container ends:
+# each is checked out until the pool has none left and disconnected (a pooled connection's disconnect() is the
+# connection's own; its close() would only hand it back to the pool)
+def reset_pool():
+    global _pool, _pool_config
+    if _pool is not None:
+        for _ in range(_pool.pool_size):
+            try:
+                connection = _pool.get_connection()
+            except pooling.PoolError:
+                break
+            except mysql.connector.Error as e:
+                # A dropped connection the pool failed to reconnect on checkout is gone already
+                logger.warning("Could not check out an idle pooled connection: %s", e)
+                continue
+            try:
+                connection.disconnect()
+            except mysql.connector.Error as e:
+                logger.warning("Could not close an idle pooled connection: %s", e)
+    _pool = None
+    _pool_config = None
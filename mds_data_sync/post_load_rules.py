@@ -0,0 +1,154 @@
+import os
+import json
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Derived-field overrides applied to the prepared progress_tracker frame before it is written
+# Each rule sets the columns in `set` on every row matching `where` (column -> value, or a list of values)
+OVERRIDES = [
+    # Non-registered studies show 0% completion (was an UPDATE on the table after every load)
+    {'name': 'unregistered_zero_completion', 'where': {'is_registered': False}, 'set': {'overall_percent_complete': 0.0}},
+]
+
+# Checks run against the synced table; results go into the lambda response
+#   unique: column                   no two rows share a value
+#   not_null: [columns]              no NULLs
+#   where + expect                   every row matching `where` has the `expect` values
+#   where + range: {column: [lo, hi]}  every row matching `where` has a value from lo to hi (NULLs are not checked)
+#   where + report                   the matching rows' `report` columns, for spot checks
+# `where` is optional. SYNC_ASSERTIONS replaces these with a JSON list of the same shape (inline, or a path to a .json file)
+DEFAULT_ASSERTIONS = [
+    {'name': 'hdp_id_unique', 'unique': 'hdp_id'},
+    {'name': 'hdp_id_not_null', 'not_null': ['hdp_id']},
+    # The override only zeroes non-registered studies; everyone else's completion comes from the parse
+    {'name': 'percent_complete_in_range', 'range': {'overall_percent_complete': [0, 100]}},
+    {'name': 'spot_check', 'where': {'appl_id': ['10056337', '9608089', '9867358', '9900258', '10320676', '9839124', '10304570']},
+     'report': ['appl_id', 'is_registered', 'overall_percent_complete']},
+]
+
+# Rows where every `where` column equals its value (or is one of a list of values); NULLs never match
+def matches(df, where):
+    mask = pd.Series(True, index=df.index)
+    for column, value in where.items():
+        values = df[column]
+        matched = values.isin(value) if isinstance(value, list) else values.eq(value)
+        mask &= matched.fillna(False).astype(bool)
+    return mask
+
+# Apply the overrides in order, in place; returns the number of rows each rule changed
+def apply_overrides(df, overrides=OVERRIDES):
+    counts = {}
+    for rule in overrides:
+        mask = matches(df, rule['where'])
+        for column, value in rule['set'].items():
+            df.loc[mask, column] = value
+        counts[rule['name']] = int(mask.sum())
+    logger.info(json.dumps({'event': 'overrides', **counts}))
+    return counts
+
+def json_rows(df, limit=None):
+    rows = df.head(limit) if limit else df
+    return rows.astype(object).where(rows.notna(), None).to_dict('records')
+
+def run_assertion(df, assertion):
+    result = {'name': assertion['name']}
+    if 'unique' in assertion:
+        duplicated = df[assertion['unique']].duplicated(keep=False)
+        failed = df[duplicated]
+    elif 'not_null' in assertion:
+        failed = df[df[assertion['not_null']].isna().any(axis=1)]
+    else:
+        rows = df[matches(df, assertion.get('where', {}))]
+        result['checked'] = len(rows)
+        if 'report' in assertion:
+            result['passed'] = True
+            result['rows'] = json_rows(rows[assertion['report']])
+            return result
+        if 'range' in assertion:
+            outside = pd.Series(False, index=rows.index)
+            for column, (low, high) in assertion['range'].items():
+                values = pd.to_numeric(rows[column], errors='coerce')
+                outside |= values.notna() & ~values.between(low, high)
+            failed = rows[outside]
+        else:
+            failed = rows[~matches(rows, assertion['expect'])]
+    result['passed'] = failed.empty
+    result['failed'] = len(failed)
+    if not failed.empty and 'hdp_id' in failed:
+        result['examples'] = failed['hdp_id'].head(5).tolist()
+    return result
+
+# Run every assertion; a failing one is logged, it does not stop the sync
+def run_assertions(df, assertions=None):
+    results = []
+    for assertion in assertions if assertions is not None else load_assertions():
+        try:
+            result = run_assertion(df, assertion)
+        except KeyError as e:
+            result = {'name': assertion.get('name'), 'passed': False, 'error': f'unknown column {e}'}
+        if not result['passed']:
+            logger.warning("Assertion failed: %s", json.dumps(result, default=str))
+        results.append(result)
+    return results
+
+# The assertions to run, checked before the sync writes anything so a bad SYNC_ASSERTIONS fails the run up front
+def load_assertions():
+    config = os.getenv('SYNC_ASSERTIONS', '')
+    if not config:
+        return DEFAULT_ASSERTIONS
+    try:
+        if config.lstrip().startswith('['):
+            assertions = json.loads(config)
+        else:
+            with open(config) as f:
+                assertions = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"SYNC_ASSERTIONS could not be read: {e}")
+    validate_assertions(assertions)
+    return assertions
+
+def validate_assertions(assertions):
+    if not isinstance(assertions, list):
+        raise ValueError("SYNC_ASSERTIONS must be a JSON list of assertions")
+    for assertion in assertions:
+        name = assertion.get('name') if isinstance(assertion, dict) else None
+        if not isinstance(name, str):
+            raise ValueError(f"SYNC_ASSERTIONS: every assertion needs a name: {assertion!r}")
+        checks = [key for key in ('unique', 'not_null', 'expect', 'range', 'report') if key in assertion]
+        if len(checks) != 1:
+            raise ValueError(f"SYNC_ASSERTIONS: {name} needs exactly one of unique, not_null, expect, range or report")
+        check = checks[0]
+        value = assertion[check]
+        if check == 'unique':
+            valid = isinstance(value, str)
+        elif check in ('not_null', 'report'):
+            valid = isinstance(value, list) and all(isinstance(column, str) for column in value)
+        elif check == 'range':
+            valid = isinstance(value, dict) and all(isinstance(bounds, list) and len(bounds) == 2 and
+                                                    all(isinstance(bound, (int, float)) for bound in bounds)
+                                                    for bounds in value.values())
+        else:
+            valid = isinstance(value, dict)
+        if not valid or not isinstance(assertion.get('where', {}), dict):
+            raise ValueError(f"SYNC_ASSERTIONS: {name} has an invalid {'where' if valid else check}")
+
+# The columns the assertions read
+def assertion_columns(assertions):
+    columns = set()
+    for assertion in assertions:
+        for key in ('not_null', 'report'):
+            columns.update(assertion.get(key, []))
+        for key in ('where', 'expect', 'range'):
+            columns.update(assertion.get(key, {}))
+        if 'unique' in assertion:
+            columns.add(assertion['unique'])
+    return sorted(columns)
+
+# `columns` of every row of `table_name`, to run the assertions on the whole table after an incremental sync
+def table_frame(cursor, table_name, columns):
+    if not columns:
+        return pd.DataFrame()
+    cursor.execute(f"SELECT {', '.join(f'`{column}`' for column in columns)} FROM `{table_name}`;")
+    return pd.DataFrame(cursor.fetchall(), columns=columns, dtype=object)
@@ -0,0 +1,184 @@
+import os
+import logging
+import uuid
+import tempfile
+from datetime import date, datetime, timezone
+import numpy as np
+import pandas as pd
+from progress_tracker_schema import create_table_sql, add_indexes_sql, ROW_HASH_COLUMN
+
+logger = logging.getLogger(__name__)
+
+# Rows per multi-row INSERT; keep a batch well under the server's max_allowed_packet
+DEFAULT_INSERT_BATCH = 500
+
+# The frame's rows as tuples of plain Python values (None for NULL) that the connector can send
+def row_values(df):
+    columns = []
+    for name in df.columns:
+        column = df[name]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            columns.append([None if pd.isna(value) else value.to_pydatetime() for value in column])
+        else:
+            columns.append([None if value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value)) else value
+                            for value in column.astype(object)])
+    return list(zip(*columns))
+
+def quoted_columns(df):
+    return ', '.join(f'`{column}`' for column in df.columns)
+
+# Multi-row INSERTs of `batch_rows` rows each; the caller commits
+def bulk_insert(cursor, table_name, df, batch_rows=DEFAULT_INSERT_BATCH):
+    rows = row_values(df)
+    placeholders = f"({', '.join(['%s'] * len(df.columns))})"
+    for start in range(0, len(rows), batch_rows):
+        batch = rows[start:start + batch_rows]
+        cursor.execute(f"INSERT INTO `{table_name}` ({quoted_columns(df)}) VALUES {', '.join([placeholders] * len(batch))};",
+                       [value for row in batch for value in row])
+    return len(rows)
+
+# One field of a LOAD DATA file: \N for NULL, everything else enclosed in quotes with \ and " escaped
+def infile_field(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        value = int(value)
+    elif isinstance(value, datetime):
+        value = value.isoformat(sep=' ')
+    elif isinstance(value, date):
+        value = value.isoformat()
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
+
+# LOAD DATA LOCAL INFILE of the whole frame
+# The connectors only read local files by path, so the rows are written to a temporary file under /tmp first.
+# Needs `allow_local_infile=True` on the connection and `local_infile=1` on the server.
+def load_infile(cursor, table_name, df):
+    rows = row_values(df)
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.csv', newline='') as f:
+        for row in rows:
+            f.write(','.join(infile_field(value) for value in row) + '\n')
+        f.flush()
+        cursor.execute(f"LOAD DATA LOCAL INFILE '{f.name}' INTO TABLE `{table_name}` CHARACTER SET utf8mb4 "
+                       "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                       f"({quoted_columns(df)});")
+    return len(rows)
+
+def table_exists(cursor, table_name):
+    cursor.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s;", (table_name,))
+    return cursor.fetchone()[0] > 0
+
+# Replace the whole table without readers ever seeing it missing or half loaded:
+# bulk load `<table>__staging`, build its secondary indexes, then swap it in with one atomic RENAME TABLE
+# `method` is 'insert' (multi-row INSERTs) or 'infile' (LOAD DATA LOCAL INFILE)
+def swap_load(connection, table_name, df, method='insert', batch_rows=DEFAULT_INSERT_BATCH):
+    staging = f'{table_name}__staging'
+    previous = f'{table_name}__previous'
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS `{staging}`, `{previous}`;")
+        cursor.execute(create_table_sql(staging, indexes=False))
+        if method == 'infile':
+            rows = load_infile(cursor, staging, df)
+        else:
+            rows = bulk_insert(cursor, staging, df, batch_rows=batch_rows)
+        connection.commit()
+        cursor.execute(add_indexes_sql(staging))
+
+        if table_exists(cursor, table_name):
+            cursor.execute(f"RENAME TABLE `{table_name}` TO `{previous}`, `{staging}` TO `{table_name}`;")
+            cursor.execute(f"DROP TABLE `{previous}`;")
+        else:
+            cursor.execute(f"RENAME TABLE `{staging}` TO `{table_name}`;")
+        logger.info("Loaded %d rows into %s and swapped it in for %s", rows, staging, table_name)
+        return rows
+    finally:
+        cursor.close()
+
+# Columns of `columns` the table does not have (all of them when the table does not exist yet)
+def missing_columns(cursor, table_name, columns):
+    cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s;", (table_name,))
+    existing = {row[0] for row in cursor.fetchall()}
+    return [column for column in columns if column not in existing]
+
+# hdp_id -> row_hash stored in the table, for every row or only for `hdp_ids`
+def stored_hashes(cursor, table_name, hdp_ids=None, batch_rows=1000):
+    if hdp_ids is None:
+        cursor.execute(f"SELECT hdp_id, `{ROW_HASH_COLUMN}` FROM `{table_name}`;")
+        return dict(cursor.fetchall())
+    stored = {}
+    for start in range(0, len(hdp_ids), batch_rows):
+        batch = hdp_ids[start:start + batch_rows]
+        cursor.execute(f"SELECT hdp_id, `{ROW_HASH_COLUMN}` FROM `{table_name}` WHERE hdp_id IN ({', '.join(['%s'] * len(batch))});", batch)
+        stored.update(cursor.fetchall())
+    return stored
+
+# Multi-row INSERT ... ON DUPLICATE KEY UPDATE, covering new and changed rows alike; the caller commits
+def bulk_upsert(cursor, table_name, df, batch_rows=DEFAULT_INSERT_BATCH):
+    rows = row_values(df)
+    placeholders = f"({', '.join(['%s'] * len(df.columns))})"
+    updates = ', '.join(f'`{column}` = VALUES(`{column}`)' for column in df.columns if column != 'hdp_id')
+    for start in range(0, len(rows), batch_rows):
+        batch = rows[start:start + batch_rows]
+        cursor.execute(f"INSERT INTO `{table_name}` ({quoted_columns(df)}) VALUES {', '.join([placeholders] * len(batch))} "
+                       f"ON DUPLICATE KEY UPDATE {updates};",
+                       [value for row in batch for value in row])
+    return len(rows)
+
+def bulk_delete(cursor, table_name, hdp_ids, batch_rows=1000):
+    for start in range(0, len(hdp_ids), batch_rows):
+        batch = hdp_ids[start:start + batch_rows]
+        cursor.execute(f"DELETE FROM `{table_name}` WHERE hdp_id IN ({', '.join(['%s'] * len(batch))});", batch)
+    return len(hdp_ids)
+
+# Write only the rows whose row_hash differs from the one stored in the table, in a single transaction
+# With `removed=None` the frame is the whole table and rows missing from it are deleted;
+# otherwise the frame holds just the re-parsed rows and `removed` lists the hdp_ids to delete
+def diff_write(connection, table_name, df, removed=None, batch_rows=DEFAULT_INSERT_BATCH):
+    cursor = connection.cursor()
+    try:
+        hdp_ids = df['hdp_id'].tolist()
+        if removed is None:
+            stored = stored_hashes(cursor, table_name)
+            deletes = sorted(set(stored) - set(hdp_ids))
+        else:
+            stored = stored_hashes(cursor, table_name, hdp_ids + list(removed))
+            deletes = sorted(set(removed) & set(stored) - set(hdp_ids))
+
+        new_rows = ~df['hdp_id'].isin(stored)
+        changed = new_rows | df['hdp_id'].map(stored).ne(df[ROW_HASH_COLUMN])
+        bulk_delete(cursor, table_name, deletes)
+        bulk_upsert(cursor, table_name, df[changed], batch_rows=batch_rows)
+        connection.commit()
+        counts = {'inserted': int(new_rows.sum()), 'updated': int((changed & ~new_rows).sum()),
+                  'deleted': len(deletes), 'unchanged': int((~changed).sum())}
+        logger.info("Differential write to %s: %s", table_name, counts)
+        return counts
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+# Data version of the table: one row in `<table>__version` that changes every time a sync changes the table's rows.
+# The query API caches responses per version (see mds_api_service/response_cache.py). It is stamped after the rows
+# are committed, so a response cached under the previous version never holds rows older than that version
+def stamp_data_version(connection, table_name):
+    version = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S.%fZ}-{uuid.uuid4().hex[:8]}"
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS `{table_name}__version` "
+                       "(id TINYINT NOT NULL PRIMARY KEY, data_version VARCHAR(64) NOT NULL, updated_at DATETIME(6) NOT NULL);")
+        cursor.execute(f"INSERT INTO `{table_name}__version` (id, data_version, updated_at) VALUES (1, %s, UTC_TIMESTAMP(6)) "
+                       "ON DUPLICATE KEY UPDATE data_version = VALUES(data_version), updated_at = VALUES(updated_at);", (version,))
+        connection.commit()
+    finally:
+        cursor.close()
+    logger.info("Stamped %s data version %s", table_name, version)
+    return version
+
+# Load method, batch size and write mode from SYNC_LOAD_METHOD / SYNC_INSERT_BATCH / SYNC_WRITE_MODE
+# SYNC_WRITE_MODE=diff (default) sends only the rows whose hash changed; swap reloads the whole table on a full rebuild
+def load_settings():
+    return (os.getenv('SYNC_LOAD_METHOD', 'insert'), int(os.getenv('SYNC_INSERT_BATCH', DEFAULT_INSERT_BATCH)),
+            os.getenv('SYNC_WRITE_MODE', 'diff'))
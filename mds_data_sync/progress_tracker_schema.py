@@ -0,0 +1,228 @@
+import json
+import hashlib
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Typed output schema of the progress_tracker table: (column, kind, MySQL type), in table order
+# The kind sets the DataFrame dtype `typed_output` converts the column to; the MySQL type goes into `create_table_sql`.
+# Missing values are real NULLs: NaN / None everywhere, and '' too for every kind except text.
+#   text     str or NULL ('' kept)                  object
+#   int      whole numbers                          Int64
+#   decimal  numbers rounded to the column's scale  Float64
+#   bool     Yes/No flags                           boolean
+#   date     ISO dates and timestamps (UTC)         datetime64[ns]
+#   json     lists / dicts serialized as JSON       object (str)
+PROGRESS_TRACKER_SCHEMA = [
+    ('hdp_id', 'text', 'VARCHAR(16) NOT NULL PRIMARY KEY'),
+    ('guid_type', 'text', 'VARCHAR(40)'),
+    ('study_name', 'text', 'TEXT'),
+    ('project_num', 'text', 'VARCHAR(64)'),
+    ('investigators_name', 'json', 'JSON'),
+    ('is_registered', 'bool', 'BOOLEAN'),
+    ('time_of_registration', 'date', 'DATETIME(6)'),
+    ('Registering user', 'text', 'VARCHAR(255)'),
+    ('archived', 'text', 'VARCHAR(16)'),
+    ('archive_date', 'date', 'DATE'),
+    ('nih_reporter_link', 'text', 'VARCHAR(255)'),
+    ('clinical_trials_study_ID', 'text', 'VARCHAR(255)'),
+    ('ov', 'text', 'VARCHAR(512)'),
+    ('repository_name', 'text', 'VARCHAR(255)'),
+    ('repository_study_id', 'text', 'VARCHAR(255)'),
+    ('repository_study_link', 'text', 'VARCHAR(512)'),
+    ('repository_metadata', 'json', 'JSON'),
+    ('year_awarded', 'int', 'SMALLINT'),
+    ('dmp_plan', 'json', 'JSON'),
+    ('manifest_exists', 'bool', 'BOOLEAN'),
+    ('data_linked_on_platform', 'bool', 'BOOLEAN'),
+    ('repository_selected', 'bool', 'BOOLEAN'),
+    ('gen3_data_availability', 'text', 'VARCHAR(32)'),
+    ('is_producing_data', 'bool', 'BOOLEAN'),
+    ('is_producing_data_not_sharing', 'bool', 'BOOLEAN'),
+    ('appl_id', 'text', 'VARCHAR(32)'),
+    ('award_type', 'text', 'VARCHAR(16)'),
+    ('award_amount', 'decimal', 'DECIMAL(14,2)'),
+    ('award_notice_date', 'date', 'DATE'),
+    ('project_end_date', 'date', 'DATE'),
+    ('project_title', 'text', 'TEXT'),
+    ('vlmd_available', 'bool', 'BOOLEAN'),
+    ('num_data_dictionaries', 'int', 'INT'),
+    ('num_common_data_elements', 'int', 'INT'),
+    ('heal_cde_used', 'json', 'JSON'),
+    ('last_cedar_update', 'date', 'DATETIME(6)'),
+    ('overall_percent_complete', 'decimal', 'DECIMAL(4,1)'),
+    ('overall_num_complete', 'int', 'INT'),
+    ('date_last_mds_update', 'date', 'DATETIME'),
+    ('appl_id_norm', 'text', 'VARCHAR(32)'),
+    ('project_num_norm', 'text', 'VARCHAR(64)'),
+    ('hdp_id_norm', 'text', 'VARCHAR(16)'),
+    ('row_hash', 'text', 'CHAR(32)'),
+]
+
+PROGRESS_TRACKER_COLUMNS = [column for column, _, _ in PROGRESS_TRACKER_SCHEMA]
+
+# row_hash fingerprints every other column except the sync timestamp, so a row whose content did not change
+# keeps its hash from one run to the next (see progress_tracker_loader.diff_write); it is filled in last,
+# after the post-load overrides (see mds_data_prep.apply_rules)
+ROW_HASH_COLUMN = 'row_hash'
+ROW_HASH_EXCLUDED = ['date_last_mds_update', ROW_HASH_COLUMN]
+
+# Lookup keys the API matches identifiers on (see mds_api_service/query_progress_tracker_table.py):
+# normalized column -> source column. Normalizing once here lets the API use plain indexed equality lookups
+# instead of REPLACE(column, '-', '') on every row
+NORMALIZED_IDENTIFIERS = {
+    'appl_id_norm': 'appl_id',
+    'project_num_norm': 'project_num',
+    'hdp_id_norm': 'hdp_id',
+}
+
+# Secondary indexes (hdp_id is the primary key): index name -> columns
+PROGRESS_TRACKER_INDEXES = {
+    'idx_appl_id': ['appl_id'],
+    'idx_project_num': ['project_num'],
+    'idx_appl_id_norm': ['appl_id_norm'],
+    'idx_project_num_norm': ['project_num_norm'],
+    'idx_hdp_id_norm': ['hdp_id_norm'],
+}
+
+# `indexes=False` leaves out the secondary indexes, for a table that is bulk loaded first (see add_indexes_sql)
+def create_table_sql(table_name, indexes=True):
+    definitions = [f'`{column}` {sql_type}' for column, _, sql_type in PROGRESS_TRACKER_SCHEMA]
+    if indexes:
+        definitions += [f"INDEX `{name}` ({', '.join(f'`{col}`' for col in columns)})" for name, columns in PROGRESS_TRACKER_INDEXES.items()]
+    columns = ',\n'.join(definitions)
+    return f"CREATE TABLE IF NOT EXISTS `{table_name}` (\n{columns}\n);"
+
+def add_indexes_sql(table_name):
+    indexes = ', '.join(f"ADD INDEX `{name}` ({', '.join(f'`{col}`' for col in columns)})" for name, columns in PROGRESS_TRACKER_INDEXES.items())
+    return f"ALTER TABLE `{table_name}` {indexes};"
+
+# Digits after the decimal point of a DECIMAL(p,s) type
+def decimal_scale(sql_type):
+    return int(sql_type.split(',')[1].rstrip(')')) if ',' in sql_type else 0
+
+# Characters a VARCHAR(n) type holds; None for the other types
+def varchar_length(sql_type):
+    return int(sql_type.split('(')[1].split(')')[0]) if sql_type.startswith('VARCHAR(') else None
+
+def is_missing(value):
+    return value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value))
+
+# Whole-number floats (an int column that picked up NaN in a merge) are written without the '.0'
+def text_value(value):
+    if is_missing(value):
+        return None
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return value if isinstance(value, str) else str(value)
+
+# Dashes and surrounding whitespace stripped, upper-cased ('CTN-0010' -> 'CTN0010', 'hdp00012' -> 'HDP00012')
+def normalized_identifier(value):
+    value = text_value(value)
+    if value is None:
+        return None
+    return value.replace('-', '').strip().upper() or None
+
+def bool_value(value):
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    return {'Yes': True, 'No': False}.get(value)
+
+def json_value(value):
+    if is_missing(value) or (isinstance(value, str) and value == ''):
+        return None
+    return json.dumps(value.tolist() if isinstance(value, np.ndarray) else value)
+
+# Numbers and numeric strings; anything else (bools, containers, '') is NULL
+def numbers(column):
+    values = [value if isinstance(value, (int, float, str, np.number)) and not isinstance(value, (bool, np.bool_)) and value != ''
+              else None for value in column]
+    return pd.Series(pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(), index=column.index).astype('Float64')
+
+# ISO date / timestamp strings; anything else is NULL
+def timestamps(column):
+    values = [value if isinstance(value, str) and value != '' else None for value in column]
+    values = pd.to_datetime(pd.Series(values, index=column.index, dtype=object), errors='coerce', utc=True, format='ISO8601')
+    return values.dt.tz_localize(None)
+
+# Values that were given but did not convert and went in as NULL, logged with a few examples
+def log_coerced(column, values):
+    given = column.map(lambda value: not is_missing(value) and not (isinstance(value, str) and value == ''))
+    coerced = column[given & values.isna()]
+    if len(coerced):
+        logger.warning("%s: %d value(s) could not be converted and are NULL, e.g. %s",
+                       column.name, len(coerced), coerced.drop_duplicates().head(3).tolist())
+
+# Text longer than a VARCHAR column holds would fail the whole load at the database; it is cut to fit and logged
+def fit_text(values, name, length):
+    long = [value for value in values if value is not None and len(value) > length]
+    if not long:
+        return values
+    logger.warning("%s: %d value(s) longer than %d characters were truncated, e.g. %r",
+                   name, len(long), length, long[0][:length + 20])
+    return [value[:length] if value is not None else None for value in values]
+
+def convert_column(column, kind, sql_type):
+    if kind == 'text':
+        values = [text_value(value) for value in column]
+        length = varchar_length(sql_type)
+        if length is not None:
+            values = fit_text(values, column.name, length)
+        return pd.Series(values, index=column.index, dtype=object)
+    if kind == 'int':
+        values = numbers(column)
+        values = values.where((values == values.round()).fillna(False))
+        log_coerced(column, values)
+        return values.astype('Int64')
+    if kind == 'decimal':
+        values = numbers(column)
+        log_coerced(column, values)
+        return values.round(decimal_scale(sql_type))
+    if kind == 'bool':
+        values = pd.Series([bool_value(value) for value in column], index=column.index, dtype='boolean')
+        log_coerced(column, values)
+        return values
+    if kind == 'date':
+        values = timestamps(column)
+        log_coerced(column, values)
+        return values.dt.normalize() if sql_type == 'DATE' else values
+    if kind == 'json':
+        return pd.Series([json_value(value) for value in column], index=column.index, dtype=object)
+    raise ValueError(f"Unknown column kind {kind} in the progress_tracker schema")
+
+def hash_value(value):
+    if is_missing(value) or value is pd.NaT:
+        return None
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat()
+    if isinstance(value, (np.bool_, np.integer, np.floating)):
+        return value.item()
+    return value
+
+# md5 of each row's hashed columns, serialized as JSON so the hash only depends on the values
+def row_hashes(df):
+    columns = [column for column in df.columns if column not in ROW_HASH_EXCLUDED]
+    values = zip(*(df[column].astype(object) for column in columns))
+    return [hashlib.md5(json.dumps([hash_value(value) for value in row], default=str).encode('utf-8')).hexdigest()
+            for row in values]
+
+# Convert the combined frame to the schema's dtypes, in table order, and fill in the normalized identifiers
+# Rows without an hdp_id (left by the positional appl_id concat in mds_data_prep.transform_metadata when
+# there are more NIH RePORTER than gen3 records) cannot be keyed in the table and are dropped
+def typed_output(df):
+    df = df.reindex(columns=PROGRESS_TRACKER_COLUMNS)
+    hdp_id = df['hdp_id'].map(text_value)
+    df = df[hdp_id.notna() & hdp_id.ne('')].copy()
+    for column, source in NORMALIZED_IDENTIFIERS.items():
+        df[column] = df[source].map(normalized_identifier)
+    typed = pd.DataFrame({column: convert_column(df[column], kind, sql_type)
+                          for column, kind, sql_type in PROGRESS_TRACKER_SCHEMA}, index=df.index)
+    return typed.reset_index(drop=True)
+
+# Usage: python progress_tracker_schema.py [table_name] - print the CREATE TABLE statement
+if __name__ == '__main__':
+    import sys
+    print(create_table_sql(sys.argv[1] if len(sys.argv) > 1 else 'progress_tracker'))
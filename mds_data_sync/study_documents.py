@@ -0,0 +1,85 @@
+import os
+import json
+import logging
+from decimal import Decimal
+from datetime import date, datetime
+import pandas as pd
+from progress_tracker_schema import PROGRESS_TRACKER_SCHEMA, NORMALIZED_IDENTIFIERS, ROW_HASH_COLUMN
+from progress_tracker_loader import bulk_insert, table_exists, DEFAULT_INSERT_BATCH
+
+logger = logging.getLogger(__name__)
+
+# Pre-rendered API responses: `<table>__documents` maps every lookup key to the finished JSON body the query API
+# returns for it (see mds_api_service/query_progress_tracker_table.py), so a lookup there is one primary key read.
+# A lookup key is `<normalized column>:<value>`, e.g. 'appl_id_norm:10056337' or 'hdp_id_norm:HDP00012', and its
+# document is the JSON list of every study with that identifier, in hdp_id order.
+
+JSON_COLUMNS = [column for column, kind, _ in PROGRESS_TRACKER_SCHEMA if kind == 'json']
+# Flags go out as "Yes" / "No", as the API returns them
+FLAG_COLUMNS = [column for column, kind, _ in PROGRESS_TRACKER_SCHEMA if kind == 'bool']
+# Kept for the sync's own use and left out of the documents, as in the API's responses
+INTERNAL_COLUMNS = list(NORMALIZED_IDENTIFIERS) + [ROW_HASH_COLUMN]
+
+# Values as the API's EnhancedEncoder writes them
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+# lookup key -> document, from the rows of the table as the connector returns them
+def render_documents(columns, rows):
+    studies = {}
+    for row in rows:
+        record = dict(zip(columns, row))
+        for column in JSON_COLUMNS:
+            if isinstance(record.get(column), (str, bytes, bytearray)):
+                record[column] = json.loads(record[column])
+        for column in FLAG_COLUMNS:
+            if record.get(column) is not None:
+                record[column] = 'Yes' if record[column] else 'No'
+        study = json.dumps({column: value for column, value in record.items() if column not in INTERNAL_COLUMNS}, default=json_default)
+        for column in NORMALIZED_IDENTIFIERS:
+            if record.get(column):
+                studies.setdefault(f'{column}:{record[column]}', []).append(study)
+    return {key: f"[{', '.join(documents)}]" for key, documents in studies.items()}
+
+# Render the documents of every study in `table_name` and swap them in as `<table>__documents`
+def rebuild_documents(connection, table_name, batch_rows=DEFAULT_INSERT_BATCH):
+    documents_table = f'{table_name}__documents'
+    staging = f'{documents_table}__staging'
+    previous = f'{documents_table}__previous'
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT * FROM `{table_name}` ORDER BY hdp_id;")
+        columns = [column[0] for column in cursor.description]
+        documents = render_documents(columns, cursor.fetchall())
+
+        cursor.execute(f"DROP TABLE IF EXISTS `{staging}`, `{previous}`;")
+        cursor.execute(f"CREATE TABLE `{staging}` (lookup_key VARCHAR(96) NOT NULL PRIMARY KEY, document LONGTEXT NOT NULL);")
+        bulk_insert(cursor, staging, pd.DataFrame({'lookup_key': list(documents), 'document': list(documents.values())}),
+                    batch_rows=batch_rows)
+        connection.commit()
+        if table_exists(cursor, documents_table):
+            cursor.execute(f"RENAME TABLE `{documents_table}` TO `{previous}`, `{staging}` TO `{documents_table}`;")
+            cursor.execute(f"DROP TABLE `{previous}`;")
+        else:
+            cursor.execute(f"RENAME TABLE `{staging}` TO `{documents_table}`;")
+        logger.info("Rendered %d lookup documents into %s", len(documents), documents_table)
+        return len(documents)
+    finally:
+        cursor.close()
+
+# Without the sync keeping them current the documents would go stale, so they are dropped and the API
+# goes back to querying the table
+def drop_documents(connection, table_name):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS `{table_name}__documents`;")
+    finally:
+        cursor.close()
+
+# SYNC_DOCUMENTS=false stops the sync from maintaining the documents table
+def documents_enabled():
+    return os.getenv('SYNC_DOCUMENTS', 'true').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,130 @@
+import sys
+import json
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# study_metadata sections that come from the CEDAR form; their keys become `cedar_study_metadata.*` columns
+CEDAR_FIELDS = ["data",
+                "study_type",
+                "minimal_info",
+                "data_availability",
+                "metadata_location",
+                "study_translational_focus",
+                "human_subject_applicability",
+                "human_condition_applicability",
+                "human_treatment_applicability",
+                "time_of_registration",
+                "time_of_last_cedar_updated"]
+
+# these are fields in the Metadata Location section in the MDS that are not on the CEDAR form.
+# We are excluding them to keep from confusing the PIs if we need to share the list
+NONCEDAR = [
+    'cedar_study_metadata.metadata_location.data_repositories',
+    'cedar_study_metadata.metadata_location.nih_reporter_link',
+    'cedar_study_metadata.metadata_location.nih_application_id',
+    'cedar_study_metadata.metadata_location.clinical_trials_study_ID',
+    'cedar_study_metadata.metadata_location.cedar_study_level_metadata_template_instance_ID'
+]
+
+# Field registry: the keys we expect in each gen3_discovery.study_metadata section
+# Sections in CEDAR_FIELDS flatten to `cedar_study_metadata.<section>.<key>`, all others to `study_metadata.<section>.<key>`.
+# Keys that are not listed here are still flattened, but show up in the schema drift report.
+STUDY_METADATA_FIELDS = {
+    'minimal_info': ['study_name', 'study_description', 'alternative_study_name', 'alternative_study_description',
+                     'alternative_study_acronym', 'study_nickname'],
+    'metadata_location': ['nih_reporter_link', 'nih_application_id', 'clinical_trials_study_ID', 'clinical_trials_study_link',
+                          'data_repositories', 'other_study_websites', 'cedar_study_level_metadata_template_instance_ID'],
+    'data_availability': ['produce_data', 'produce_other', 'data_restricted', 'data_collection_status', 'data_release_status',
+                          'data_collection_start_date', 'data_collection_finish_date', 'data_release_start_date',
+                          'data_release_finish_date'],
+    'study_translational_focus': ['study_translational_topic', 'study_translational_approach'],
+    'study_type': ['study_stage', 'study_primary_or_secondary', 'study_observational_or_experimental', 'study_subject_type',
+                   'study_type_design'],
+    'human_treatment_applicability': ['treatment_mode', 'treatment_novelty', 'treatment_application_level', 'treatment_type'],
+    'human_condition_applicability': ['condition_category', 'research_focus_condition', 'research_focus_clinical_condition'],
+    'human_subject_applicability': ['age_applicability', 'sex_applicability', 'gender_applicability', 'irb_status',
+                                    'subject_type', 'subject_behavior', 'subject_geographic', 'subject_other'],
+    'data': ['data_type', 'data_collection_method', 'data_level', 'data_file_format', 'data_source', 'data_source_other'],
+    'time_of_registration': [],
+    'time_of_last_cedar_updated': [],
+    'citation': ['heal_funded_status', 'study_collection_status', 'heal_platform_persistent_ID', 'heal_platform_citation'],
+    'contacts_and_registrants': ['contacts', 'registrants'],
+    'findings': ['primary_publications', 'primary_study_findings', 'secondary_publications'],
+}
+
+def column_name(section, key):
+    if section in CEDAR_FIELDS:
+        return f'cedar_study_metadata.{section}.{key}'
+    return f'study_metadata.{section}.{key}'
+
+# The registry compiled once at import: section -> {key: flattened column name}
+COMPILED_FIELDS = {section: {key: column_name(section, key) for key in keys} for section, keys in STUDY_METADATA_FIELDS.items()}
+
+# Flattens study_metadata into a record in a single pass, with column names looked up rather than formatted per cell
+# Sections and keys outside the registry are flattened the same way (so the output does not depend on the registry)
+# and counted per record for the drift report
+class StudyMetadataFlattener:
+    def __init__(self, compiled=COMPILED_FIELDS):
+        self.compiled = compiled
+        self.extra_names = {}
+        self.unknown_sections = Counter()
+        self.unknown_keys = Counter()
+        self.invalid_sections = Counter()
+
+    def _extra_name(self, section, key):
+        name = self.extra_names.get((section, key))
+        if name is None:
+            name = self.extra_names[(section, key)] = column_name(section, key)
+        return name
+
+    def flatten(self, study_metadata, out):
+        for section, fields in study_metadata.items():
+            if not isinstance(fields, dict):
+                self.invalid_sections[section] += 1
+                continue
+            names = self.compiled.get(section)
+            if names is None:
+                self.unknown_sections[section] += 1
+                names = {}
+            for key, value in fields.items():
+                name = names.get(key)
+                if name is None:
+                    if section in self.compiled:
+                        self.unknown_keys[f'{section}.{key}'] += 1
+                    name = self._extra_name(section, key)
+                out[name] = value
+        return out
+
+    # Add the drift counted by another flattener (e.g. one per parse shard)
+    def update(self, other):
+        self.unknown_sections.update(other.unknown_sections)
+        self.unknown_keys.update(other.unknown_keys)
+        self.invalid_sections.update(other.invalid_sections)
+
+    # Number of records with each unknown section / key, or an empty dict when nothing drifted
+    def report(self):
+        drift = {}
+        if self.unknown_sections:
+            drift['unknown_sections'] = dict(self.unknown_sections)
+        if self.unknown_keys:
+            drift['unknown_keys'] = dict(self.unknown_keys)
+        if self.invalid_sections:
+            drift['invalid_sections'] = dict(self.invalid_sections)
+        return drift
+
+# Check a guid -> record mapping (or stream of pairs) against the registry without parsing anything else
+def check_schema(response_json):
+    records = response_json.items() if isinstance(response_json, dict) else response_json
+    flattener = StudyMetadataFlattener()
+    for guid, record in records:
+        study_metadata = (record.get('gen3_discovery') or {}).get('study_metadata')
+        if isinstance(study_metadata, dict):
+            flattener.flatten(study_metadata, {})
+    return flattener.report()
+
+# Usage: python study_metadata_schema.py <mds_dump.json | snapshot ref>
+if __name__ == '__main__':
+    from mds_snapshot import load_snapshot
+    print(json.dumps(check_schema(load_snapshot(sys.argv[1], stream=True)), indent=4))
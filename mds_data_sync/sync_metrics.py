@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Resident set size of this process in MB (None where /proc is not available, e.g. macOS)
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+# Peak resident set size of this process in MB (ru_maxrss is in KB on Linux)
+def peak_rss_mb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+# One timed pipeline stage; rows/columns describe what the stage produced
+class Span:
+    def __init__(self, stage):
+        self.stage = stage
+        self.seconds = None
+        self.rows = None
+        self.columns = None
+        self.mem_delta_mb = None
+
+    # Rows are the longest frame, columns the total over all frames
+    def set_frames(self, *frames):
+        self.rows = max((len(df) for df in frames), default=0)
+        self.columns = sum(len(df.columns) for df in frames)
+
+    def as_dict(self):
+        return {
+            'stage': self.stage,
+            'seconds': round(self.seconds, 4) if self.seconds is not None else None,
+            'rows': self.rows,
+            'columns': self.columns,
+            'mem_delta_mb': round(self.mem_delta_mb, 1) if self.mem_delta_mb is not None else None
+        }
+
+# Collects one span per stage of a sync run and logs each as a single JSON line as it finishes
+# The run summary (see `summary`) goes into the lambda response so sync cost can be charted over time
+class SyncMetrics:
+    def __init__(self):
+        self.spans = []
+        self.counts = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage):
+        span = Span(stage)
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - start
+            rss_after = rss_mb()
+            if rss_before is not None and rss_after is not None:
+                span.mem_delta_mb = rss_after - rss_before
+            self.spans.append(span)
+            logger.info(json.dumps(dict(event='sync_stage', **span.as_dict())))
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def summary(self):
+        peak = peak_rss_mb()
+        return {
+            'total_seconds': round(time.perf_counter() - self.started, 4),
+            'peak_rss_mb': round(peak, 1) if peak is not None else None,
+            'stages': [span.as_dict() for span in self.spans],
+            'counts': self.counts
+        }
@@ -0,0 +1,166 @@
+import sqlite3
+import hashlib
+import json
+from study_metadata_schema import CEDAR_FIELDS
+
+DEFAULT_STATE_PATH = '/tmp/mds_sync_state.sqlite'
+
+# Stable hash of a raw MDS record; keys are sorted so the hash only changes when the content does
+def content_hash(record):
+    payload = json.dumps(record, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def cedar_update_time(record):
+    gen3_discovery = record.get('gen3_discovery') or {}
+    return str(gen3_discovery.get('time_of_last_cedar_updated') or '')
+
+# The `cedar_study_metadata.*` columns a record's study_metadata flattens to (see study_metadata_schema.py)
+def cedar_columns(gen3_discovery):
+    study_metadata = gen3_discovery.get('study_metadata')
+    if not isinstance(study_metadata, dict):
+        return []
+    return [f'cedar_study_metadata.{section}.{key}' for section, fields in study_metadata.items()
+            if section in CEDAR_FIELDS and isinstance(fields, dict) for key in fields]
+
+# Added/changed/removed guids for one sync run
+# `filter_records` hashes every record on its way into parse_mds_response and only lets
+# added or changed ones through; `removed` is known once the whole catalog has been seen
+class SyncDelta:
+    def __init__(self, previous, full, data_version=None):
+        self.previous = previous
+        self.full = full
+        # The table's data version the run started from, replaced by the one it stamps (see SyncState.start_delta)
+        self.data_version = data_version
+        self.seen = {}
+        self.added = []
+        self.changed = []
+        # What the completion of every row depends on, over the whole catalog (see `catalog`)
+        self.cedar_columns = set()
+        self.has_cedar_update = False
+        self.first_cedar_update = None
+        self.gen3_seen = False
+
+    def filter_records(self, records):
+        records = records.items() if isinstance(records, dict) else records
+        for guid, record in records:
+            # Hash before parsing since parse_mds_response edits the gen3_discovery section in place
+            record_hash = content_hash(record)
+            self.seen[guid] = (record_hash, cedar_update_time(record))
+            self.observe(record)
+            if guid not in self.previous:
+                self.added.append(guid)
+            elif self.previous[guid] != record_hash:
+                self.changed.append(guid)
+            elif not self.full:
+                continue
+            yield guid, record
+
+    def observe(self, record):
+        if 'gen3_discovery' not in record:
+            return
+        gen3_discovery = record['gen3_discovery']
+        if not self.gen3_seen:
+            self.gen3_seen = True
+            self.first_cedar_update = gen3_discovery.get('time_of_last_cedar_updated')
+        self.has_cedar_update = self.has_cedar_update or 'time_of_last_cedar_updated' in gen3_discovery
+        self.cedar_columns.update(cedar_columns(gen3_discovery))
+
+    # The CEDAR fields any study has (the denominator of every study's completion) and the first study's
+    # time_of_last_cedar_updated (stamped on every study), as a full parse of the catalog seen so far works them
+    # out: '' when no study has a cedar update, None when the first study has none
+    @property
+    def catalog(self):
+        return {'cedar_columns': sorted(self.cedar_columns),
+                'cedar_update': self.first_cedar_update if self.has_cedar_update else ''}
+
+    @property
+    def removed(self):
+        return [guid for guid in self.previous if guid not in self.seen]
+
+    # guids whose existing rows have to be deleted before the new rows are written
+    @property
+    def stale(self):
+        return self.changed + self.removed
+
+    def is_empty(self):
+        return not (self.full or self.added or self.changed or self.removed)
+
+    def summary(self):
+        return {
+            'mode': 'full' if self.full else 'incremental',
+            'seen': len(self.seen),
+            'added': len(self.added),
+            'changed': len(self.changed),
+            'removed': len(self.removed)
+        }
+
+# Small SQLite store of each guid's content hash and time_of_last_cedar_updated from the last successful sync
+# State is tied to the target table, so pointing the sync at a different table forces a full rebuild
+class SyncState:
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("create table if not exists guid_state (guid text primary key, content_hash text not null, time_of_last_cedar_updated text)")
+        self.conn.execute("create table if not exists sync_meta (key text primary key, value text)")
+        self.conn.commit()
+
+    def load_hashes(self):
+        return dict(self.conn.execute("select guid, content_hash from guid_state"))
+
+    # The catalog (see SyncDelta.catalog) the table was last written with; None before it was stored
+    def catalog(self):
+        row = self.conn.execute("select value from sync_meta where key = 'catalog'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Set from the moment a run writes rows until their documents and data version are published (see
+    # lambda_function.write_changes), so a run that fails in between still publishes on the next run, whose
+    # differential write then finds nothing left to change
+    def publish_pending(self, target):
+        row = self.conn.execute("select value from sync_meta where key = 'publish_pending'").fetchone()
+        return row is not None and row[0] == target
+
+    def set_publish_pending(self, target, pending):
+        with self.conn:
+            if pending:
+                self.conn.execute("insert or replace into sync_meta (key, value) values ('publish_pending', ?)", (target,))
+            else:
+                self.conn.execute("delete from sync_meta where key = 'publish_pending'")
+
+    def target(self):
+        row = self.conn.execute("select value from sync_meta where key = 'target'").fetchone()
+        return row[0] if row else None
+
+    # The table's data version when this state was committed; None before it was stored
+    def data_version(self):
+        row = self.conn.execute("select value from sync_meta where key = 'data_version'").fetchone()
+        return row[0] if row else None
+
+    # Start a run; with no stored state (first run, fresh /tmp) or `full_rebuild` every guid is processed
+    # The state lives in one container's /tmp, so when the table's `data_version` differs from the one stored with
+    # it, another container wrote the table since, and its rows are no longer the ones these hashes describe
+    def start_delta(self, target, full_rebuild=False, data_version=None):
+        previous = self.load_hashes()
+        full = full_rebuild or not previous or self.target() != target or self.data_version() != data_version
+        return SyncDelta(previous, full, data_version)
+
+    # Record the run only after the table write succeeded, so a failed run is retried in full next time
+    def commit(self, delta, target):
+        if delta.full:
+            guids = list(delta.seen)
+        else:
+            guids = delta.added + delta.changed
+        with self.conn:
+            if delta.full:
+                self.conn.execute("delete from guid_state")
+            else:
+                self.conn.executemany("delete from guid_state where guid = ?", [(guid,) for guid in delta.removed])
+            self.conn.executemany(
+                "insert or replace into guid_state (guid, content_hash, time_of_last_cedar_updated) values (?, ?, ?)",
+                [(guid,) + delta.seen[guid] for guid in guids]
+            )
+            self.conn.execute("insert or replace into sync_meta (key, value) values ('target', ?)", (target,))
+            self.conn.execute("insert or replace into sync_meta (key, value) values ('catalog', ?)", (json.dumps(delta.catalog),))
+            self.conn.execute("insert or replace into sync_meta (key, value) values ('data_version', ?)", (delta.data_version,))
+
+    def close(self):
+        self.conn.close()